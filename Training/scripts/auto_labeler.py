@@ -4,13 +4,20 @@ Auto-label extracted PDF features using heuristics and patterns.
 Creates training labels for section detection, rule classification, and section type.
 """
 
-import json
+import argparse
 import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from tqdm import tqdm
 import sys
 
+# Add pdf-processor to path for the shared keyword matcher
+sys.path.append(str(Path(__file__).parent.parent.parent / "pdf-processor"))
+
+from keyword_matcher import KeywordMatcher
+from block_store import list_documents, document_name, load_document, save_document, FORMATS
+
 INPUT_DIR = Path(__file__).parent.parent / "data" / "processed"
 OUTPUT_DIR = Path(__file__).parent.parent / "data" / "labeled"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -28,6 +35,15 @@ SECTION_KEYWORDS = {
     "faq": ["faq", "frequently asked questions", "questions", "troubleshooting"],
 }
 
+# Every section keyword in one matcher, labelled with its section type
+SECTION_MATCHER = KeywordMatcher({
+    keyword: section_type
+    for section_type, keywords in SECTION_KEYWORDS.items()
+    for keyword in keywords
+})
+# Earlier types win when a heading mentions several
+SECTION_TYPE_PRIORITY = {section_type: i for i, section_type in enumerate(SECTION_KEYWORDS)}
+
 # Rule indicators
 RULE_INDICATORS = [
     r"\b(must|should|cannot|may not|do not|don't|cannot|shall|will)\b",
@@ -50,13 +66,46 @@ EXPLANATION_INDICATORS = [
 ]
 
 
-def is_section_heading(block: Dict[str, Any], all_blocks: List[Dict[str, Any]]) -> bool:
+def _combine(patterns: List[str]) -> re.Pattern:
+    """One compiled pattern that matches wherever any of patterns matches."""
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
+
+
+# Each indicator list as a single pattern, so a block is scanned once per list
+EXAMPLE_PATTERN = _combine(EXAMPLE_INDICATORS)
+EXPLANATION_PATTERN = _combine(EXPLANATION_INDICATORS)
+RULE_PATTERN = _combine(RULE_INDICATORS)
+
+ALL_CAPS_PATTERN = re.compile(r"^[A-Z][A-Z\s]+$")
+NUMBERED_HEADING_PATTERN = re.compile(r"^\d+\.\s+[A-Z]")
+
+# Blocks this much larger than the document's average font size are headings
+HEADING_FONT_RATIO = 1.2
+
+
+def document_stats(blocks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Compute the document-level statistics is_section_heading needs, once per PDF.
+    
+    Args:
+        blocks: All blocks of the document
+        
+    Returns:
+        Dictionary with the average font size (None if no block has one)
+    """
+    font_sizes = [b.get("font_size", 0) for b in blocks if b.get("font_size")]
+    return {
+        "avg_font_size": sum(font_sizes) / len(font_sizes) if font_sizes else None,
+    }
+
+
+def is_section_heading(block: Dict[str, Any], stats: Dict[str, Any]) -> bool:
     """
     Determine if a text block is a section heading.
     
     Args:
         block: Text block to check
-        all_blocks: All blocks for context
+        stats: Statistics of the block's document, from document_stats()
         
     Returns:
         True if likely a section heading
@@ -66,29 +115,24 @@ def is_section_heading(block: Dict[str, Any], all_blocks: List[Dict[str, Any]])
         return False
     
     # Check font size (headings are usually larger)
-    font_sizes = [b.get("font_size", 0) for b in all_blocks if b.get("font_size")]
-    if font_sizes:
-        avg_font_size = sum(font_sizes) / len(font_sizes)
-        if block.get("font_size", 0) > avg_font_size * 1.2:
-            return True
+    avg_font_size = stats["avg_font_size"]
+    if avg_font_size is not None and block.get("font_size", 0) > avg_font_size * HEADING_FONT_RATIO:
+        return True
     
     # Check if bold
     if block.get("is_bold", False) and len(text) < 100:
         return True
     
     # Check common patterns
-    if re.match(r"^[A-Z][A-Z\s]+$", text):  # ALL CAPS
+    if ALL_CAPS_PATTERN.match(text):  # ALL CAPS
         return True
     
-    if re.match(r"^\d+\.\s+[A-Z]", text):  # Numbered heading
+    if NUMBERED_HEADING_PATTERN.match(text):  # Numbered heading
         return True
     
     # Check if matches section keywords
-    text_lower = text.lower()
-    for section_type, keywords in SECTION_KEYWORDS.items():
-        for keyword in keywords:
-            if keyword in text_lower and len(text) < 100:
-                return True
+    if len(text) < 100 and SECTION_MATCHER.search(text):
+        return True
     
     return False
 
@@ -103,12 +147,9 @@ def classify_section_type(heading_text: str) -> str:
     Returns:
         Section type (setup, gameplay, scoring, etc.)
     """
-    text_lower = heading_text.lower()
-    
-    for section_type, keywords in SECTION_KEYWORDS.items():
-        for keyword in keywords:
-            if keyword in text_lower:
-                return section_type
+    section_types = SECTION_MATCHER.labels(heading_text)
+    if section_types:
+        return min(section_types, key=SECTION_TYPE_PRIORITY.get)
     
     return "other"
 
@@ -126,22 +167,15 @@ def classify_text_type(text: str) -> str:
     text_lower = text.lower()
     
     # Check for example indicators
-    for pattern in EXAMPLE_INDICATORS:
-        if re.search(pattern, text_lower, re.IGNORECASE):
-            return "example"
+    if EXAMPLE_PATTERN.search(text_lower):
+        return "example"
     
     # Check for explanation indicators
-    for pattern in EXPLANATION_INDICATORS:
-        if re.search(pattern, text_lower, re.IGNORECASE):
-            return "explanation"
-    
-    # Check for rule indicators
-    rule_score = 0
-    for pattern in RULE_INDICATORS:
-        if re.search(pattern, text_lower, re.IGNORECASE):
-            rule_score += 1
+    if EXPLANATION_PATTERN.search(text_lower):
+        return "explanation"
     
-    if rule_score >= 1:
+    # Check for rule indicators (any one is enough)
+    if RULE_PATTERN.search(text_lower):
         return "rule"
     
     # Default to other
@@ -161,6 +195,9 @@ def auto_label_pdf(processed_data: Dict[str, Any]) -> Dict[str, Any]:
     blocks = processed_data.get("blocks", [])
     labeled_blocks = []
     
+    # Document statistics, computed once instead of per block
+    stats = document_stats(blocks)
+    
     current_section_type = "other"
     
     for i, block in enumerate(blocks):
@@ -169,7 +206,7 @@ def auto_label_pdf(processed_data: Dict[str, Any]) -> Dict[str, Any]:
             continue
         
         # Check if this is a section heading
-        is_heading = is_section_heading(block, blocks)
+        is_heading = is_section_heading(block, stats)
         
         labeled_block = {
             **block,
@@ -197,11 +234,46 @@ def auto_label_pdf(processed_data: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def label_all_pdfs():
-    """Label all processed PDFs."""
+def label_file(processed_file: Path, fmt: str = "columnar") -> Optional[str]:
+    """
+    Label one processed PDF and save it to OUTPUT_DIR.
+    
+    Args:
+        processed_file: Processed document (either format)
+        fmt: Output format, "columnar" or "json"
+        
+    Returns:
+        Error message, or None on success
+    """
+    try:
+        # Load processed data (either format)
+        processed_data = load_document(processed_file, tables=("blocks", "page_texts"))
+        
+        # Auto-label
+        labeled_data = auto_label_pdf(processed_data)
+        if fmt == "columnar":
+            # labeled_blocks has every non-empty block; don't store them twice
+            del labeled_data["blocks"]
+        
+        # Save labeled data
+        save_document(OUTPUT_DIR, document_name(processed_file), labeled_data, fmt)
+        return None
+    
+    except Exception as e:
+        return str(e)
+
+
+def label_all_pdfs(fmt: str = "columnar", workers: int = 1):
+    """
+    Label all processed PDFs.
+    
+    Args:
+        fmt: Output format, "columnar" (memory-mappable columns) or "json"
+        workers: Processes labeling PDFs in parallel (1 = serial)
+    """
     print("🏷️  Auto-labeling PDFs...")
     
-    processed_files = list(INPUT_DIR.glob("*.json"))
+    processed_files = list_documents(INPUT_DIR)
     print(f"Found {len(processed_files)} processed PDFs")
     
     if not processed_files:
@@ -211,24 +283,21 @@ def label_all_pdfs():
     
     labeled_count = 0
     
-    for processed_file in tqdm(processed_files, desc="Labeling"):
-        try:
-            # Load processed data
-            with open(processed_file, "r", encoding="utf-8") as f:
-                processed_data = json.load(f)
-            
-            # Auto-label
-            labeled_data = auto_label_pdf(processed_data)
-            
-            # Save labeled data
-            output_file = OUTPUT_DIR / processed_file.name
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump(labeled_data, f, indent=2, ensure_ascii=False)
-            
+    def record(processed_file: Path, error: Optional[str]):
+        nonlocal labeled_count
+        if error is not None:
+            print(f"\n❌ Error labeling {processed_file}: {error}")
+        else:
             labeled_count += 1
-            
-        except Exception as e:
-            print(f"\n❌ Error labeling {processed_file}: {e}")
+    
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(label_file, processed_file, fmt): processed_file for processed_file in processed_files}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Labeling"):
+                record(futures[future], future.result())
+    else:
+        for processed_file in tqdm(processed_files, desc="Labeling"):
+            record(processed_file, label_file(processed_file, fmt))
     
     print(f"\n✅ Labeling complete!")
     print(f"   Labeled: {labeled_count} PDFs")
@@ -236,10 +305,17 @@ def label_all_pdfs():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Auto-label processed rulebook PDFs")
+    parser.add_argument("--format", choices=FORMATS, default="columnar",
+                        help="Output format (default: columnar)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes labeling PDFs in parallel (default: 1)")
+    args = parser.parse_args()
+    
     if not INPUT_DIR.exists():
         print(f"❌ Processed data directory not found: {INPUT_DIR}")
         print("   Run process_pdfs.py first")
         sys.exit(1)
     
-    label_all_pdfs()
+    label_all_pdfs(fmt=args.format, workers=args.workers)
 
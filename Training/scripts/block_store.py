@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Columnar storage for extracted and labeled text blocks.
+Each document is a directory with one memory-mappable .npy file per column and
+a meta.json; strings are kept in a UTF-8 byte table with offsets, missing
+values in a null mask, and nested values as JSON text. Stages load
+only the columns they need instead of parsing a whole pretty-printed JSON file.
+The JSON format is still read and written for compatibility.
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Any, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+STORE_SUFFIX = ".blocks"
+META_FILE = "meta.json"
+
+# Keys of a document that hold one row per block/page; everything else is metadata
+TABLES = ("blocks", "labeled_blocks", "page_texts")
+
+FORMATS = ("columnar", "json")
+
+# Value of a column in a row that doesn't have the key (as opposed to None)
+MISSING = object()
+
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+class StringColumn:
+    """Strings of one column, decoded on access from a memory-mapped byte table."""
+    
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+    
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, i: int) -> str:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+    
+    def __iter__(self) -> Iterator[str]:
+        raw = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield raw[start:end].decode("utf-8")
+
+
+class CategoryColumn:
+    """Repeated strings (or None) stored as codes into a list of categories."""
+    
+    def __init__(self, codes: np.ndarray, categories: List[str]):
+        self.codes = codes
+        self.categories = categories
+    
+    def __len__(self) -> int:
+        return len(self.codes)
+    
+    def __getitem__(self, i: int) -> Optional[str]:
+        code = int(self.codes[i])
+        return self.categories[code] if code >= 0 else None
+    
+    def __iter__(self) -> Iterator[Optional[str]]:
+        for code in self.codes.tolist():
+            yield self.categories[code] if code >= 0 else None
+
+
+class JsonColumn(StringColumn):
+    """Nested or mixed-type values, stored as JSON text and decoded on access."""
+    
+    def __getitem__(self, i: int) -> Any:
+        return json.loads(super().__getitem__(i))
+    
+    def __iter__(self) -> Iterator[Any]:
+        for text in super().__iter__():
+            yield json.loads(text)
+
+
+class NullableColumn:
+    """Numeric or boolean values with a mask of the missing ones (read as None)."""
+    
+    def __init__(self, values: np.ndarray, nulls: np.ndarray):
+        self.values = values
+        self.nulls = nulls
+    
+    def __len__(self) -> int:
+        return len(self.values)
+    
+    def __getitem__(self, i: int) -> Any:
+        return None if self.nulls[i] else self.values[i].item()
+    
+    def __iter__(self) -> Iterator[Any]:
+        for value, null in zip(self.values.tolist(), self.nulls.tolist()):
+            yield None if null else value
+
+
+class PartialColumn:
+    """Values of a column some rows don't have; those read as MISSING."""
+    
+    def __init__(self, values: Sequence, present: np.ndarray):
+        self.values = values
+        self.present = present
+    
+    def __len__(self) -> int:
+        return len(self.present)
+    
+    def __getitem__(self, i: int) -> Any:
+        if not self.present[i]:
+            return MISSING
+        value = self.values[i]
+        return value.item() if isinstance(value, np.generic) else value
+    
+    def __iter__(self) -> Iterator[Any]:
+        values = self.values.tolist() if isinstance(self.values, np.ndarray) else self.values
+        for value, present in zip(values, self.present.tolist()):
+            yield value if present else MISSING
+
+
+def _column_kind(values: List[Any]) -> str:
+    """Storage kind for a column's values: bool, int, float, string, category or json."""
+    present = [value for value in values if value is not None]
+    if not present:
+        return "category"
+    if all(isinstance(value, bool) for value in present):
+        return "bool"
+    if any(isinstance(value, int) and not INT64_MIN <= value <= INT64_MAX for value in present):
+        # Too large for int64 (or for float64 without losing digits)
+        return "json"
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in present):
+        return "int"
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+        return "float"
+    if all(isinstance(value, str) for value in present):
+        return "string" if len(present) == len(values) else "category"
+    # Lists, dictionaries and mixed types
+    return "json"
+
+
+def _write_strings(table_dir: Path, prefix: str, values: List[str]):
+    """Write strings as a UTF-8 byte table with offsets."""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    np.save(table_dir / f"{prefix}.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    np.save(table_dir / f"{prefix}.offsets.npy", offsets)
+
+
+def _write_column(table_dir: Path, prefix: str, values: List[Any], present: List[bool]) -> Dict[str, Any]:
+    """
+    Write one column's files and return its schema entry.
+    
+    Args:
+        table_dir: Document directory
+        prefix: File name prefix ("<table>.<column>")
+        values: Value per row (None where the row doesn't have the key)
+        present: Whether each row has the key
+    
+    Raises:
+        TypeError: If the column holds values that can't be stored as JSON
+    """
+    kind = _column_kind(values)
+    schema = {"kind": kind}
+    
+    if not all(present):
+        # Rows without the key are masked separately from None values
+        np.save(table_dir / f"{prefix}.present.npy", np.array(present, dtype=np.bool_))
+        schema["partial"] = True
+    
+    if kind in ("bool", "int", "float") and None in values:
+        # Missing values are masked instead of stored as False, 0 or NaN
+        np.save(table_dir / f"{prefix}.nulls.npy", np.array([value is None for value in values], dtype=np.bool_))
+        schema["nullable"] = True
+    
+    if kind == "bool":
+        np.save(table_dir / f"{prefix}.npy", np.array([bool(value) for value in values], dtype=np.bool_))
+    elif kind == "int":
+        np.save(table_dir / f"{prefix}.npy", np.array([0 if value is None else value for value in values], dtype=np.int64))
+    elif kind == "float":
+        np.save(table_dir / f"{prefix}.npy", np.array([0.0 if value is None else value for value in values], dtype=np.float64))
+    elif kind == "string":
+        _write_strings(table_dir, prefix, values)
+    elif kind == "json":
+        try:
+            encoded = [json.dumps(value, ensure_ascii=False) for value in values]
+        except TypeError as e:
+            raise TypeError(f"Column {prefix} can't be stored: {e}") from e
+        _write_strings(table_dir, prefix, encoded)
+    else:
+        categories = sorted({str(value) for value in values if value is not None})
+        index = {category: i for i, category in enumerate(categories)}
+        codes = np.array([-1 if value is None else index[str(value)] for value in values], dtype=np.int32)
+        np.save(table_dir / f"{prefix}.npy", codes)
+        schema["categories"] = categories
+    
+    return schema
+
+
+def write_columnar(doc_dir: Path, meta: Dict[str, Any], tables: Dict[str, List[Dict[str, Any]]]):
+    """
+    Write a document in the columnar format.
+    
+    The document is written to a temporary directory and moved into place,
+    so readers never see a partial document.
+    
+    Args:
+        doc_dir: Document directory (ending in STORE_SUFFIX)
+        meta: JSON-serializable document metadata
+        tables: Table name -> rows
+    """
+    tmp_dir = doc_dir.with_name(doc_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+    
+    schema = {}
+    for table, rows in tables.items():
+        names = list(dict.fromkeys(name for row in rows for name in row))
+        schema[table] = {
+            "rows": len(rows),
+            "columns": {
+                name: _write_column(tmp_dir, f"{table}.{name}", [row.get(name) for row in rows], [name in row for row in rows])
+                for name in names
+            },
+        }
+    
+    with open(tmp_dir / META_FILE, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "tables": schema}, f, ensure_ascii=False)
+    
+    if doc_dir.exists():
+        shutil.rmtree(doc_dir)
+    os.replace(tmp_dir, doc_dir)
+
+
+def read_columnar(doc_dir: Path, table: str, columns: Optional[Sequence[str]] = None) -> Tuple[Dict[str, Any], int, Dict[str, Sequence]]:
+    """
+    Read columns of one table from a columnar document.
+    
+    Args:
+        doc_dir: Document directory
+        table: Table name
+        columns: Columns to load (default: all); missing ones are skipped
+    
+    Returns:
+        (metadata, row count, column name -> values); numeric columns
+        without missing values are memory-mapped arrays, other columns
+        decode on access, and rows without a key read as MISSING
+    """
+    with open(doc_dir / META_FILE, "r", encoding="utf-8") as f:
+        header = json.load(f)
+    
+    schema = header["tables"].get(table, {"rows": 0, "columns": {}})
+    names = schema["columns"] if columns is None else [name for name in columns if name in schema["columns"]]
+    
+    loaded = {}
+    for name in names:
+        column = schema["columns"][name]
+        prefix = doc_dir / f"{table}.{name}"
+        values = np.load(f"{prefix}.npy", mmap_mode="r")
+        if column["kind"] == "string":
+            loaded[name] = StringColumn(values, np.load(f"{prefix}.offsets.npy", mmap_mode="r"))
+        elif column["kind"] == "json":
+            loaded[name] = JsonColumn(values, np.load(f"{prefix}.offsets.npy", mmap_mode="r"))
+        elif column["kind"] == "category":
+            loaded[name] = CategoryColumn(values, column["categories"])
+        elif column.get("nullable"):
+            loaded[name] = NullableColumn(values, np.load(f"{prefix}.nulls.npy", mmap_mode="r"))
+        else:
+            loaded[name] = values
+        
+        if column.get("partial"):
+            loaded[name] = PartialColumn(loaded[name], np.load(f"{prefix}.present.npy", mmap_mode="r"))
+    
+    return header["meta"], schema["rows"], loaded
+
+
+def list_documents(directory: Path) -> List[Path]:
+    """
+    Documents in a stage directory, in either format.
+    
+    If a document exists in both formats (the format changed between runs),
+    the more recently written one is used.
+    """
+    documents = {}
+    candidates = [path for path in directory.glob(f"*{STORE_SUFFIX}") if (path / META_FILE).exists()]
+    candidates += list(directory.glob("*.json"))
+    for path in sorted(candidates, key=lambda path: path.stat().st_mtime):
+        documents[document_name(path)] = path
+    return sorted(documents.values())
+
+
+def document_name(path: Path) -> str:
+    """Document name without the format suffix (the PDF id)."""
+    return path.name[:-len(STORE_SUFFIX)] if path.name.endswith(STORE_SUFFIX) else path.stem
+
+
+def save_document(directory: Path, name: str, data: Dict[str, Any], fmt: str = "columnar") -> Path:
+    """
+    Save a document: metadata plus the TABLES it contains.
+    
+    Args:
+        directory: Stage output directory
+        name: Document name (the PDF id)
+        data: Document in the JSON layout (tables as lists of row dictionaries)
+        fmt: "columnar" or "json"
+    
+    Returns:
+        Path of the saved document
+    """
+    if fmt == "json":
+        output_file = directory / f"{name}.json"
+        tmp_file = output_file.with_suffix(".json.tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, output_file)
+        return output_file
+    
+    meta = {key: value for key, value in data.items() if key not in TABLES}
+    tables = {key: value for key, value in data.items() if key in TABLES}
+    doc_dir = directory / f"{name}{STORE_SUFFIX}"
+    write_columnar(doc_dir, meta, tables)
+    return doc_dir
+
+
+def load_columns(path: Path, table: str, columns: Optional[Sequence[str]] = None) -> Tuple[Dict[str, Any], int, Dict[str, Sequence]]:
+    """
+    Load columns of one table from a document in either format.
+    
+    Args:
+        path: Document directory or JSON file
+        table: Table name
+        columns: Columns to load (default: all)
+    
+    Returns:
+        (metadata, row count, column name -> values); rows without a key
+        read as MISSING
+    """
+    if path.is_dir():
+        return read_columnar(path, table, columns)
+    
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    
+    rows = data.get(table, [])
+    if columns is None:
+        columns = list(dict.fromkeys(name for row in rows for name in row))
+    meta = {key: value for key, value in data.items() if key not in TABLES}
+    return meta, len(rows), {name: [row.get(name, MISSING) for row in rows] for name in columns}
+
+
+def iter_rows(row_count: int, columns: Dict[str, Sequence]) -> Iterator[Dict[str, Any]]:
+    """
+    Yield rows as dictionaries of Python values; MISSING values are left out.
+    
+    Args:
+        row_count: Number of rows
+        columns: Column name -> values (as returned by load_columns)
+    """
+    values = []
+    for column in columns.values():
+        if isinstance(column, np.ndarray):
+            values.append(column.tolist())
+        else:
+            values.append(list(column))
+    
+    names = list(columns)
+    for i in range(row_count):
+        yield {name: column[i] for name, column in zip(names, values) if column[i] is not MISSING}
+
+
+def load_document(path: Path, tables: Sequence[str] = TABLES, columns: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    Load a document in the JSON layout (tables as lists of row dictionaries).
+    
+    Args:
+        path: Document directory or JSON file
+        tables: Tables to load
+        columns: Columns to load from each table (default: all)
+    
+    Returns:
+        Metadata plus the requested tables
+    """
+    if not path.is_dir():
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for table in TABLES:
+            if table in data and table not in tables:
+                del data[table]
+            elif table in data and columns is not None:
+                data[table] = [{name: row[name] for name in columns if name in row} for row in data[table]]
+        return data
+    
+    with open(path / META_FILE, "r", encoding="utf-8") as f:
+        header = json.load(f)
+    
+    document = dict(header["meta"])
+    for table in tables:
+        if table in header["tables"]:
+            _, row_count, loaded = read_columnar(path, table, columns)
+            document[table] = list(iter_rows(row_count, loaded))
+    return document
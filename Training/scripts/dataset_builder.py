@@ -2,16 +2,22 @@
 """
 Build training/validation/test datasets from labeled PDFs.
 Creates datasets for each ML task: section detection, rule classification, section type.
+The labeled corpus is read in a single streaming pass; examples for all three
+tasks are appended to JSONL files as they are produced, and splits are derived
+from a stable hash, so memory stays flat as the corpus grows. By default whole
+rulebooks are assigned to one split, so test scores reflect unseen games.
 """
 
+import argparse
+import hashlib
 import json
-import random
 from pathlib import Path
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Iterator
 from tqdm import tqdm
-import pandas as pd
 import sys
 
+from block_store import list_documents, document_name, load_document
+
 INPUT_DIR = Path(__file__).parent.parent / "data" / "labeled"
 OUTPUT_DIR = Path(__file__).parent.parent / "data" / "splits"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -21,219 +27,209 @@ TRAIN_RATIO = 0.7
 VAL_RATIO = 0.15
 TEST_RATIO = 0.15
 
+SPLITS = ("train", "val", "test")
+TASKS = ("section_detection", "rule_classification", "section_type")
+
+# Changing the seed reshuffles every split
+SPLIT_SEED = "42"
+
+# "document": every example of a PDF goes to the PDF's split (no rulebook in both train and test)
+# "example": each example is assigned on its own
+SPLIT_MODES = ("document", "example")
+
+# Labeled block columns the three tasks read
+LABELED_COLUMNS = ["text", "font_size", "is_bold", "is_section_heading", "text_type", "section_type"]
 
-def build_section_detection_dataset(labeled_files: List[Path]) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+# Rule classification classes
+CLASS_MAP = {"rule": 0, "example": 1, "explanation": 2, "other": 3}
+
+# Section type classes
+SECTION_TYPES = ["setup", "gameplay", "objective", "scoring", "end_game", "advanced", "examples", "faq", "other"]
+TYPE_MAP = {st: i for i, st in enumerate(SECTION_TYPES)}
+
+
+def assign_split(key: str) -> str:
     """
-    Build dataset for section heading detection (binary classification).
+    Assign a split from a stable hash of key.
+    
+    The same key always lands in the same split, independent of corpus size
+    and processing order.
     
     Args:
-        labeled_files: List of labeled PDF files
-        
+        key: Identity of what is being split
+    
     Returns:
-        (train, val, test) datasets
+        "train", "val" or "test"
     """
-    examples = []
-    
-    for labeled_file in tqdm(labeled_files, desc="Building section detection dataset"):
-        try:
-            with open(labeled_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            blocks = data.get("labeled_blocks", [])
-            
-            for block in blocks:
-                text = block.get("text", "").strip()
-                if not text or len(text) < 3:
-                    continue
-                
-                examples.append({
-                    "text": text,
-                    "label": 1 if block.get("is_section_heading", False) else 0,
-                    "font_size": block.get("font_size", 0),
-                    "is_bold": 1 if block.get("is_bold", False) else 0,
-                    "pdf_id": data.get("pdf_id", ""),
-                })
-        
-        except Exception as e:
-            print(f"Error processing {labeled_file}: {e}")
-    
-    # Shuffle and split
-    random.shuffle(examples)
-    n = len(examples)
-    train_end = int(n * TRAIN_RATIO)
-    val_end = train_end + int(n * VAL_RATIO)
-    
-    train = examples[:train_end]
-    val = examples[train_end:val_end]
-    test = examples[val_end:]
+    digest = hashlib.sha256(f"{SPLIT_SEED}:{key}".encode("utf-8")).digest()
+    fraction = int.from_bytes(digest[:8], "big") / 2 ** 64
     
-    return train, val, test
+    if fraction < TRAIN_RATIO:
+        return "train"
+    if fraction < TRAIN_RATIO + VAL_RATIO:
+        return "val"
+    return "test"
 
 
-def build_rule_classification_dataset(labeled_files: List[Path]) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+def section_detection_examples(data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
     """
-    Build dataset for rule classification (multi-class: rule, example, explanation, other).
+    Examples for section heading detection (binary classification) from one labeled PDF.
     
     Args:
-        labeled_files: List of labeled PDF files
-        
-    Returns:
-        (train, val, test) datasets
-    """
-    examples = []
-    
-    # Class mapping
-    class_map = {"rule": 0, "example": 1, "explanation": 2, "other": 3}
+        data: Labeled PDF with labeled_blocks
     
-    for labeled_file in tqdm(labeled_files, desc="Building rule classification dataset"):
-        try:
-            with open(labeled_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            blocks = data.get("labeled_blocks", [])
-            
-            for i, block in enumerate(blocks):
-                text = block.get("text", "").strip()
-                text_type = block.get("text_type")
-                
-                # Skip headings and empty text
-                if block.get("is_section_heading", False) or not text or len(text) < 10:
-                    continue
-                
-                if text_type not in class_map:
-                    continue
-                
-                # Get context (previous and next blocks)
-                context_before = ""
-                context_after = ""
-                
-                if i > 0:
-                    prev_text = blocks[i-1].get("text", "").strip()
-                    if not blocks[i-1].get("is_section_heading", False):
-                        context_before = prev_text[-200:]  # Last 200 chars
-                
-                if i < len(blocks) - 1:
-                    next_text = blocks[i+1].get("text", "").strip()
-                    if not blocks[i+1].get("is_section_heading", False):
-                        context_after = next_text[:200]  # First 200 chars
-                
-                examples.append({
-                    "text": text,
-                    "context_before": context_before,
-                    "context_after": context_after,
-                    "label": class_map[text_type],
-                    "label_name": text_type,
-                    "pdf_id": data.get("pdf_id", ""),
-                })
+    Yields:
+        Examples in document order
+    """
+    for block in data.get("labeled_blocks", []):
+        text = block.get("text", "").strip()
+        if not text or len(text) < 3:
+            continue
         
-        except Exception as e:
-            print(f"Error processing {labeled_file}: {e}")
+        yield {
+            "text": text,
+            "label": 1 if block.get("is_section_heading", False) else 0,
+            "font_size": block.get("font_size", 0),
+            "is_bold": 1 if block.get("is_bold", False) else 0,
+            "pdf_id": data.get("pdf_id", ""),
+        }
+
+
+def rule_classification_examples(data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Examples for rule classification (multi-class: rule, example, explanation, other) from one labeled PDF.
     
-    # Shuffle and split
-    random.shuffle(examples)
-    n = len(examples)
-    train_end = int(n * TRAIN_RATIO)
-    val_end = train_end + int(n * VAL_RATIO)
+    Args:
+        data: Labeled PDF with labeled_blocks
     
-    train = examples[:train_end]
-    val = examples[train_end:val_end]
-    test = examples[val_end:]
+    Yields:
+        Examples in document order
+    """
+    blocks = data.get("labeled_blocks", [])
     
-    return train, val, test
+    for i, block in enumerate(blocks):
+        text = block.get("text", "").strip()
+        text_type = block.get("text_type")
+        
+        # Skip headings and empty text
+        if block.get("is_section_heading", False) or not text or len(text) < 10:
+            continue
+        
+        if text_type not in CLASS_MAP:
+            continue
+        
+        # Get context (previous and next blocks)
+        context_before = ""
+        context_after = ""
+        
+        if i > 0:
+            prev_text = blocks[i-1].get("text", "").strip()
+            if not blocks[i-1].get("is_section_heading", False):
+                context_before = prev_text[-200:]  # Last 200 chars
+        
+        if i < len(blocks) - 1:
+            next_text = blocks[i+1].get("text", "").strip()
+            if not blocks[i+1].get("is_section_heading", False):
+                context_after = next_text[:200]  # First 200 chars
+        
+        yield {
+            "text": text,
+            "context_before": context_before,
+            "context_after": context_after,
+            "label": CLASS_MAP[text_type],
+            "label_name": text_type,
+            "pdf_id": data.get("pdf_id", ""),
+        }
 
 
-def build_section_type_dataset(labeled_files: List[Path]) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+def section_type_examples(data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
     """
-    Build dataset for section type classification.
+    Examples for section type classification from one labeled PDF.
     
     Args:
-        labeled_files: List of labeled PDF files
-        
-    Returns:
-        (train, val, test) datasets
+        data: Labeled PDF with labeled_blocks
+    
+    Yields:
+        One example per section with content, in document order
     """
-    examples = []
+    def section_example(heading: Dict[str, Any], section_blocks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        section_type = heading.get("section_type", "other")
+        section_text = " ".join([b.get("text", "") for b in section_blocks[:10]])  # First 10 blocks
+        
+        return {
+            "heading": heading.get("text", ""),
+            "content": section_text[:500],  # First 500 chars
+            "label": TYPE_MAP.get(section_type, TYPE_MAP["other"]),
+            "label_name": section_type,
+            "pdf_id": data.get("pdf_id", ""),
+        }
     
-    # Section type mapping
-    section_types = ["setup", "gameplay", "objective", "scoring", "end_game", "advanced", "examples", "faq", "other"]
-    type_map = {st: i for i, st in enumerate(section_types)}
+    # Group blocks by section
+    current_section = None
+    section_blocks = []
     
-    for labeled_file in tqdm(labeled_files, desc="Building section type dataset"):
-        try:
-            with open(labeled_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            blocks = data.get("labeled_blocks", [])
+    for block in data.get("labeled_blocks", []):
+        if block.get("is_section_heading", False):
+            # Save previous section
+            if current_section and section_blocks:
+                yield section_example(current_section, section_blocks)
             
-            # Group blocks by section
-            current_section = None
+            # Start new section
+            current_section = block
             section_blocks = []
-            
-            for block in blocks:
-                if block.get("is_section_heading", False):
-                    # Save previous section
-                    if current_section and section_blocks:
-                        section_type = current_section.get("section_type", "other")
-                        section_text = " ".join([b.get("text", "") for b in section_blocks[:10]])  # First 10 blocks
-                        
-                        examples.append({
-                            "heading": current_section.get("text", ""),
-                            "content": section_text[:500],  # First 500 chars
-                            "label": type_map.get(section_type, type_map["other"]),
-                            "label_name": section_type,
-                            "pdf_id": data.get("pdf_id", ""),
-                        })
-                    
-                    # Start new section
-                    current_section = block
-                    section_blocks = []
-                else:
-                    section_blocks.append(block)
-            
-            # Save last section
-            if current_section and section_blocks:
-                section_type = current_section.get("section_type", "other")
-                section_text = " ".join([b.get("text", "") for b in section_blocks[:10]])
-                
-                examples.append({
-                    "heading": current_section.get("text", ""),
-                    "content": section_text[:500],
-                    "label": type_map.get(section_type, type_map["other"]),
-                    "label_name": section_type,
-                    "pdf_id": data.get("pdf_id", ""),
-                })
-        
-        except Exception as e:
-            print(f"Error processing {labeled_file}: {e}")
-    
-    # Shuffle and split
-    random.shuffle(examples)
-    n = len(examples)
-    train_end = int(n * TRAIN_RATIO)
-    val_end = train_end + int(n * VAL_RATIO)
+        else:
+            section_blocks.append(block)
     
-    train = examples[:train_end]
-    val = examples[train_end:val_end]
-    test = examples[val_end:]
-    
-    return train, val, test
+    # Save last section
+    if current_section and section_blocks:
+        yield section_example(current_section, section_blocks)
 
 
-def save_datasets(train: List[Dict], val: List[Dict], test: List[Dict], task_name: str):
-    """Save datasets to JSON files."""
-    for split_name, split_data in [("train", train), ("val", val), ("test", test)]:
-        output_file = OUTPUT_DIR / f"{task_name}_{split_name}.json"
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(split_data, f, indent=2, ensure_ascii=False)
-        
-        print(f"   {split_name}: {len(split_data)} examples")
+# Example generators per task
+TASK_EXAMPLES = {
+    "section_detection": section_detection_examples,
+    "rule_classification": rule_classification_examples,
+    "section_type": section_type_examples,
+}
 
 
-def build_all_datasets():
-    """Build all training datasets."""
-    print("📊 Building training datasets...")
+class SplitWriter:
+    """Append-only JSONL files, one per task and split."""
     
-    labeled_files = list(INPUT_DIR.glob("*.json"))
+    def __init__(self, output_dir: Path):
+        self.files = {}
+        self.counts = {}
+        for task in TASKS:
+            for split in SPLITS:
+                self.files[(task, split)] = open(output_dir / f"{task}_{split}.jsonl", "w", encoding="utf-8")
+                self.counts[(task, split)] = 0
+    
+    def write(self, task: str, split: str, example: Dict[str, Any]):
+        self.files[(task, split)].write(json.dumps(example, ensure_ascii=False) + "\n")
+        self.counts[(task, split)] += 1
+    
+    def close(self):
+        for f in self.files.values():
+            f.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build_all_datasets(split_by: str = "document"):
+    """
+    Build all training datasets in one pass over the labeled PDFs.
+    
+    Args:
+        split_by: "document" to assign each PDF to one split by its pdf_id,
+            or "example" to assign examples independently
+    """
+    print(f"📊 Building training datasets (split by {split_by})...")
+    
+    labeled_files = list_documents(INPUT_DIR)
     print(f"Found {len(labeled_files)} labeled PDFs")
     
     if not labeled_files:
@@ -241,33 +237,50 @@ def build_all_datasets():
         print("   Run auto_labeler.py first")
         return
     
-    # Set random seed for reproducibility
-    random.seed(42)
+    documents_per_split = {split: 0 for split in SPLITS}
     
-    # Build section detection dataset
-    print("\n1. Section Detection Dataset:")
-    train, val, test = build_section_detection_dataset(labeled_files)
-    save_datasets(train, val, test, "section_detection")
+    with SplitWriter(OUTPUT_DIR) as writer:
+        for labeled_file in tqdm(labeled_files, desc="Building datasets"):
+            try:
+                # Each labeled PDF is loaded once, with only the columns the tasks use
+                data = load_document(labeled_file, tables=("labeled_blocks",), columns=LABELED_COLUMNS)
+            except Exception as e:
+                print(f"Error processing {labeled_file}: {e}")
+                continue
+            
+            pdf_id = data.get("pdf_id") or document_name(labeled_file)
+            document_split = assign_split(pdf_id)
+            documents_per_split[document_split] += 1
+            
+            for task, examples in TASK_EXAMPLES.items():
+                for i, example in enumerate(examples(data)):
+                    if split_by == "document":
+                        split = document_split
+                    else:
+                        split = assign_split(f"{pdf_id}:{task}:{i}")
+                    writer.write(task, split, example)
     
-    # Build rule classification dataset
-    print("\n2. Rule Classification Dataset:")
-    train, val, test = build_rule_classification_dataset(labeled_files)
-    save_datasets(train, val, test, "rule_classification")
+    if split_by == "document":
+        print("\nPDFs per split: " + ", ".join(f"{split}: {count}" for split, count in documents_per_split.items()))
     
-    # Build section type dataset
-    print("\n3. Section Type Dataset:")
-    train, val, test = build_section_type_dataset(labeled_files)
-    save_datasets(train, val, test, "section_type")
+    for i, task in enumerate(TASKS, 1):
+        print(f"\n{i}. {task.replace('_', ' ').title()} Dataset:")
+        for split in SPLITS:
+            print(f"   {split}: {writer.counts[(task, split)]} examples")
     
     print(f"\n✅ Dataset building complete!")
     print(f"   Output directory: {OUTPUT_DIR}")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build train/val/test datasets from labeled PDFs")
+    parser.add_argument("--split-by", choices=SPLIT_MODES, default="document",
+                        help="Assign whole PDFs or single examples to splits (default: document)")
+    args = parser.parse_args()
+    
     if not INPUT_DIR.exists():
         print(f"❌ Labeled data directory not found: {INPUT_DIR}")
         print("   Run auto_labeler.py first")
         sys.exit(1)
     
-    build_all_datasets()
-
+    build_all_datasets(split_by=args.split_by)
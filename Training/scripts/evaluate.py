@@ -4,6 +4,7 @@ Evaluate trained models on test sets.
 Generates metrics, confusion matrices, and error analysis.
 """
 
+import argparse
 import json
 import torch
 import numpy as np
@@ -30,17 +31,47 @@ OUTPUT_DIR = Path(__file__).parent.parent / "evaluation"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 BASE_MODEL = "distilbert-base-uncased"
+# Quantized export written by export_onnx.py
+ONNX_MODEL_FILE = "model.int8.onnx"
 
 
-def evaluate_model(model_dir: Path, dataset_class, test_file: Path, task_name: str):
+def predict_onnx(onnx_path: Path, test_dataset) -> list:
+    """
+    Predict the test set with a quantized ONNX export.
+    
+    Args:
+        onnx_path: Path to the exported model
+        test_dataset: Tokenized test dataset
+        
+    Returns:
+        Predicted class per example
+    """
+    import onnxruntime as ort
+    
+    session = ort.InferenceSession(str(onnx_path), providers=["CPUExecutionProvider"])
+    predictions = []
+    
+    for i in tqdm(range(len(test_dataset)), desc="Evaluating ONNX"):
+        item = test_dataset[i]
+        logits = session.run(["logits"], {
+            "input_ids": item["input_ids"].unsqueeze(0).numpy().astype(np.int64),
+            "attention_mask": item["attention_mask"].unsqueeze(0).numpy().astype(np.int64),
+        })[0]
+        predictions.append(int(np.argmax(logits, axis=1)[0]))
+    
+    return predictions
+
+
+def evaluate_model(model_dir: Path, dataset_class, test_file: Path, task_name: str, compare_onnx: bool = False):
     """
     Evaluate a trained model on test set.
     
     Args:
         model_dir: Directory containing trained model
         dataset_class: Dataset class to use
-        test_file: Path to test dataset JSON
+        test_file: Path to test dataset JSONL
         task_name: Name of the task (for output)
+        compare_onnx: Also evaluate the quantized ONNX export and report the accuracy delta
     """
     print(f"\n{'='*60}")
     print(f"Evaluating {task_name}")
@@ -116,6 +147,32 @@ def evaluate_model(model_dir: Path, dataset_class, test_file: Path, task_name: s
         "confusion_matrix": cm.tolist(),
     }
     
+    # Compare with the quantized ONNX export
+    onnx_path = model_dir / ONNX_MODEL_FILE
+    if compare_onnx and not onnx_path.exists():
+        print(f"\n⚠️  ONNX model not found: {onnx_path}")
+        print("   Run export_onnx.py first")
+    elif compare_onnx:
+        onnx_predictions = predict_onnx(onnx_path, test_dataset)
+        onnx_accuracy = accuracy_score(labels, onnx_predictions)
+        _, _, onnx_f1, _ = precision_recall_fscore_support(
+            labels, onnx_predictions, average="weighted", zero_division=0
+        )
+        agreement = float(np.mean(np.array(onnx_predictions) == np.array(predictions)))
+        
+        results["onnx"] = {
+            "accuracy": float(onnx_accuracy),
+            "f1": float(onnx_f1),
+            "accuracy_delta": float(onnx_accuracy - accuracy),
+            "f1_delta": float(onnx_f1 - f1),
+            "agreement": agreement,
+        }
+        
+        print(f"\n📦 ONNX int8:")
+        print(f"   Accuracy: {onnx_accuracy:.4f} ({onnx_accuracy - accuracy:+.4f})")
+        print(f"   F1-Score: {onnx_f1:.4f} ({onnx_f1 - f1:+.4f})")
+        print(f"   Agreement with PyTorch: {agreement:.4f}")
+    
     results_file = OUTPUT_DIR / f"{task_name}_results.json"
     with open(results_file, "w") as f:
         json.dump(results, f, indent=2)
@@ -135,7 +192,7 @@ def evaluate_model(model_dir: Path, dataset_class, test_file: Path, task_name: s
     return results
 
 
-def evaluate_all_models():
+def evaluate_all_models(compare_onnx: bool = False):
     """Evaluate all trained models."""
     print("📊 Evaluating Models")
     print("="*60)
@@ -144,26 +201,26 @@ def evaluate_all_models():
     
     # Evaluate section detector
     model_dir = MODELS_DIR / "section_detector"
-    test_file = DATA_DIR / "section_detection_test.json"
+    test_file = DATA_DIR / "section_detection_test.jsonl"
     if model_dir.exists() and test_file.exists():
         results["section_detection"] = evaluate_model(
-            model_dir, SectionDetectionDataset, test_file, "section_detection"
+            model_dir, SectionDetectionDataset, test_file, "section_detection", compare_onnx
         )
     
     # Evaluate rule classifier
     model_dir = MODELS_DIR / "rule_classifier"
-    test_file = DATA_DIR / "rule_classification_test.json"
+    test_file = DATA_DIR / "rule_classification_test.jsonl"
     if model_dir.exists() and test_file.exists():
         results["rule_classification"] = evaluate_model(
-            model_dir, RuleClassificationDataset, test_file, "rule_classification"
+            model_dir, RuleClassificationDataset, test_file, "rule_classification", compare_onnx
         )
     
     # Evaluate section classifier
     model_dir = MODELS_DIR / "section_classifier"
-    test_file = DATA_DIR / "section_type_test.json"
+    test_file = DATA_DIR / "section_type_test.jsonl"
     if model_dir.exists() and test_file.exists():
         results["section_classifier"] = evaluate_model(
-            model_dir, SectionTypeDataset, test_file, "section_type"
+            model_dir, SectionTypeDataset, test_file, "section_type", compare_onnx
         )
     
     # Summary
@@ -176,6 +233,8 @@ def evaluate_all_models():
             print(f"\n{task}:")
             print(f"  Accuracy: {result['accuracy']:.4f}")
             print(f"  F1-Score: {result['f1']:.4f}")
+            if "onnx" in result:
+                print(f"  ONNX accuracy delta: {result['onnx']['accuracy_delta']:+.4f}")
     
     # Save summary
     summary_file = OUTPUT_DIR / "evaluation_summary.json"
@@ -186,5 +245,10 @@ def evaluate_all_models():
 
 
 if __name__ == "__main__":
-    evaluate_all_models()
+    parser = argparse.ArgumentParser(description="Evaluate trained models on the test sets")
+    parser.add_argument("--onnx", action="store_true",
+                        help="Also evaluate the quantized ONNX exports and report the accuracy delta")
+    args = parser.parse_args()
+    
+    evaluate_all_models(compare_onnx=args.onnx)
 
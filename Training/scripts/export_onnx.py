@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Export trained models to ONNX and quantize them to int8.
+Writes model.int8.onnx next to each model for ML_BACKEND=onnx in pdf-processor.
+"""
+
+import argparse
+import tempfile
+from pathlib import Path
+
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from onnxruntime.quantization import quantize_dynamic, QuantType
+
+MODELS_DIR = Path(__file__).parent.parent / "models"
+MODEL_NAMES = ["section_detector", "rule_classifier", "section_classifier"]
+ONNX_MODEL_FILE = "model.int8.onnx"
+OPSET_VERSION = 14
+
+
+def export_model(model_dir: Path) -> Path:
+    """
+    Export one model to ONNX with dynamic batch and sequence axes, then
+    apply dynamic int8 quantization to its weights.
+    
+    Args:
+        model_dir: Directory containing a trained model and tokenizer
+    
+    Returns:
+        Path to the quantized ONNX model
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    model.eval()
+    
+    sample = tokenizer(["Setup", "Place the board in the center of the table."], padding=True, return_tensors="pt")
+    output_path = model_dir / ONNX_MODEL_FILE
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fp32_path = Path(tmp_dir) / "model.onnx"
+        
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                (sample["input_ids"], sample["attention_mask"]),
+                str(fp32_path),
+                input_names=["input_ids", "attention_mask"],
+                output_names=["logits"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "logits": {0: "batch"},
+                },
+                opset_version=OPSET_VERSION,
+            )
+        
+        quantize_dynamic(str(fp32_path), str(output_path), weight_type=QuantType.QInt8)
+    
+    return output_path
+
+
+def export_all_models(names=None):
+    """Export every trained model (or the given ones)."""
+    print("📦 Exporting models to ONNX (int8)")
+    print("="*60)
+    
+    for name in names or MODEL_NAMES:
+        model_dir = MODELS_DIR / name
+        if not model_dir.exists():
+            print(f"⚠️  Skipping {name}: model not found at {model_dir}")
+            continue
+        
+        output_path = export_model(model_dir)
+        size_mb = output_path.stat().st_size / (1024 * 1024)
+        print(f"✅ {name}: {output_path} ({size_mb:.1f} MB)")
+    
+    print("\nRun evaluate.py --onnx to compare accuracy with the PyTorch models")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export trained models to quantized ONNX")
+    parser.add_argument("models", nargs="*", metavar="MODEL",
+                        help=f"Models to export: {', '.join(MODEL_NAMES)} (default: all)")
+    args = parser.parse_args()
+    
+    unknown = set(args.models) - set(MODEL_NAMES)
+    if unknown:
+        parser.error(f"unknown models: {', '.join(sorted(unknown))}")
+    
+    export_all_models(args.models)
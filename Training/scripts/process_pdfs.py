@@ -6,13 +6,20 @@ Extracts text blocks with font information, position, and formatting.
 
 import os
 import json
+import hashlib
+import signal
 import pdfplumber
 import fitz  # PyMuPDF
+from contextlib import contextmanager
 from pathlib import Path
 from tqdm import tqdm
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
 import sys
 
+from block_store import save_document, FORMATS
+
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
@@ -21,159 +28,386 @@ PDFS_DIR = Path(__file__).parent.parent.parent / "Training" / "rules_pdfs"
 OUTPUT_DIR = Path(__file__).parent.parent / "data" / "processed"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# One line per processed PDF, appended as each one finishes so a crashed run resumes
+MANIFEST_FILE = OUTPUT_DIR / "manifest.jsonl"
+
+
+class FileTimeoutError(Exception):
+    """Raised when a PDF takes longer than the per-file timeout."""
+    pass
 
-def extract_text_blocks(pdf_path: Path) -> List[Dict[str, Any]]:
+
+@contextmanager
+def time_limit(seconds: int):
     """
-    Extract text blocks with formatting information from PDF.
+    Raise FileTimeoutError if the block runs longer than seconds.
+    
+    Uses SIGALRM, so it only applies in the main thread of a process on Unix;
+    elsewhere (or with seconds <= 0) the block runs without a limit.
+    """
+    if seconds <= 0 or not hasattr(signal, "SIGALRM"):
+        yield
+        return
+    
+    def on_alarm(signum, frame):
+        raise FileTimeoutError(f"timed out after {seconds}s")
+    
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.alarm(seconds)
+    try:
+        yield
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def extract_page_blocks(pdf_path: Path, start: int = 0, end: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Extract text blocks with formatting information from a range of pages.
     
     Args:
         pdf_path: Path to PDF file
+        start: First page index (0-based)
+        end: Page index to stop before (default: end of document)
         
     Returns:
         List of text blocks with features
     """
     blocks = []
     
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages, 1):
-                # Extract text with character-level formatting
-                chars = page.chars
-                if not chars:
-                    continue
-                
-                # Group characters into blocks by font and position
-                current_block = {
-                    "text": "",
-                    "font_size": None,
-                    "font_name": None,
-                    "is_bold": False,
-                    "page": page_num,
-                    "x0": None,
-                    "y0": None,
-                    "x1": None,
-                    "y1": None,
-                }
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_num, page in enumerate(pdf.pages[start:end], start + 1):
+            # Extract text with character-level formatting
+            chars = page.chars
+            if not chars:
+                continue
+            
+            # Group characters into blocks by font and position
+            current_block = {
+                "text": "",
+                "font_size": None,
+                "font_name": None,
+                "is_bold": False,
+                "page": page_num,
+                "x0": None,
+                "y0": None,
+                "x1": None,
+                "y1": None,
+            }
+            
+            for char in chars:
+                char_text = char.get("text", "")
+                char_size = char.get("size", 0)
+                char_font = char.get("fontname", "")
+                char_bold = "Bold" in char_font or "bold" in char_font.lower()
+                char_x0 = char.get("x0", 0)
+                char_y0 = char.get("top", 0)
+                char_x1 = char.get("x1", 0)
+                char_y1 = char.get("bottom", 0)
                 
-                for char in chars:
-                    char_text = char.get("text", "")
-                    char_size = char.get("size", 0)
-                    char_font = char.get("fontname", "")
-                    char_bold = "Bold" in char_font or "bold" in char_font.lower()
-                    char_x0 = char.get("x0", 0)
-                    char_y0 = char.get("top", 0)
-                    char_x1 = char.get("x1", 0)
-                    char_y1 = char.get("bottom", 0)
+                # Start new block if font changes significantly
+                if (current_block["font_size"] and 
+                    abs(char_size - current_block["font_size"]) > 2):
+                    if current_block["text"].strip():
+                        blocks.append(current_block.copy())
+                    current_block = {
+                        "text": char_text,
+                        "font_size": char_size,
+                        "font_name": char_font,
+                        "is_bold": char_bold,
+                        "page": page_num,
+                        "x0": char_x0,
+                        "y0": char_y0,
+                        "x1": char_x1,
+                        "y1": char_y1,
+                    }
+                else:
+                    # Continue current block
+                    if not current_block["font_size"]:
+                        current_block["font_size"] = char_size
+                        current_block["font_name"] = char_font
+                        current_block["is_bold"] = char_bold
+                        current_block["x0"] = char_x0
+                        current_block["y0"] = char_y0
+                        current_block["x1"] = char_x1
+                        current_block["y1"] = char_y1
                     
-                    # Start new block if font changes significantly
-                    if (current_block["font_size"] and 
-                        abs(char_size - current_block["font_size"]) > 2):
-                        if current_block["text"].strip():
-                            blocks.append(current_block.copy())
-                        current_block = {
-                            "text": char_text,
-                            "font_size": char_size,
-                            "font_name": char_font,
-                            "is_bold": char_bold,
-                            "page": page_num,
-                            "x0": char_x0,
-                            "y0": char_y0,
-                            "x1": char_x1,
-                            "y1": char_y1,
-                        }
-                    else:
-                        # Continue current block
-                        if not current_block["font_size"]:
-                            current_block["font_size"] = char_size
-                            current_block["font_name"] = char_font
-                            current_block["is_bold"] = char_bold
-                            current_block["x0"] = char_x0
-                            current_block["y0"] = char_y0
-                            current_block["x1"] = char_x1
-                            current_block["y1"] = char_y1
-                        
-                        current_block["text"] += char_text
-                        # Update bounding box
-                        if char_x0 < current_block["x0"]:
-                            current_block["x0"] = char_x0
-                        if char_y0 < current_block["y0"]:
-                            current_block["y0"] = char_y0
-                        if char_x1 > current_block["x1"]:
-                            current_block["x1"] = char_x1
-                        if char_y1 > current_block["y1"]:
-                            current_block["y1"] = char_y1
-                
-                # Add last block
-                if current_block["text"].strip():
-                    blocks.append(current_block)
-        
-        # Also extract full page text for context
-        with fitz.open(pdf_path) as doc:
-            page_texts = []
-            for page_num, page in enumerate(doc, 1):
-                page_texts.append({
-                    "page": page_num,
-                    "full_text": page.get_text(),
-                })
+                    current_block["text"] += char_text
+                    # Update bounding box
+                    if char_x0 < current_block["x0"]:
+                        current_block["x0"] = char_x0
+                    if char_y0 < current_block["y0"]:
+                        current_block["y0"] = char_y0
+                    if char_x1 > current_block["x1"]:
+                        current_block["x1"] = char_x1
+                    if char_y1 > current_block["y1"]:
+                        current_block["y1"] = char_y1
+            
+            # Add last block
+            if current_block["text"].strip():
+                blocks.append(current_block)
+    
+    return blocks
+
+
+def extract_text_blocks(pdf_path: Path, page_workers: int = 1, executor: Optional[ProcessPoolExecutor] = None) -> Dict[str, Any]:
+    """
+    Extract text blocks with formatting information from PDF.
+    
+    Args:
+        pdf_path: Path to PDF file
+        page_workers: Processes to split the pages across (1 = serial)
+        executor: Pool with page_workers workers to reuse across PDFs
         
-        return {
-            "blocks": blocks,
-            "page_texts": page_texts,
-            "total_pages": len(page_texts),
-        }
+    Returns:
+        Dictionary with text blocks, page texts and page count
+    """
+    with fitz.open(pdf_path) as doc:
+        total_pages = len(doc)
+    
+    if page_workers <= 1 or total_pages < page_workers * 2:
+        blocks = extract_page_blocks(pdf_path)
+    else:
+        # Shard pages across processes and merge the blocks in page order
+        shard_size = -(-total_pages // (page_workers * 2))
+        ranges = [(start, min(start + shard_size, total_pages)) for start in range(0, total_pages, shard_size)]
+        pool = executor or ProcessPoolExecutor(max_workers=page_workers)
+        futures = [pool.submit(extract_page_blocks, pdf_path, start, end) for start, end in ranges]
+        try:
+            blocks = [block for future in futures for block in future.result()]
+        finally:
+            # Shards not started yet are dropped if the PDF failed or timed out
+            for future in futures:
+                future.cancel()
+            if executor is None:
+                pool.shutdown()
+    
+    # Also extract full page text for context
+    with fitz.open(pdf_path) as doc:
+        page_texts = []
+        for page_num, page in enumerate(doc, 1):
+            page_texts.append({
+                "page": page_num,
+                "full_text": page.get_text(),
+            })
+    
+    return {
+        "blocks": blocks,
+        "page_texts": page_texts,
+        "total_pages": len(page_texts),
+    }
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest() -> Dict[str, Dict[str, Any]]:
+    """
+    Load the manifest of processed PDFs.
+    
+    Returns:
+        Mapping of PDF path (relative to PDFS_DIR) to its latest entry
+    """
+    manifest = {}
+    if not MANIFEST_FILE.exists():
+        return manifest
+    
+    with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Line cut short by a crash
+            manifest[entry["path"]] = entry
+    return manifest
+
+
+def save_manifest(manifest: Dict[str, Dict[str, Any]]):
+    """Rewrite the manifest with one entry per PDF."""
+    tmp_file = MANIFEST_FILE.with_suffix(".tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        for entry in manifest.values():
+            f.write(json.dumps(entry) + "\n")
+    os.replace(tmp_file, MANIFEST_FILE)
+
+
+def is_unchanged(pdf_path: Path, entry: Optional[Dict[str, Any]], fmt: str = "columnar") -> bool:
+    """
+    Whether a PDF was already processed in its current state (and format).
+    
+    Size and mtime decide without reading the file; if only the mtime
+    changed (e.g. the file was copied or touched), the hash decides and the
+    entry takes the new mtime.
+    """
+    if entry is None or entry.get("format", "json") != fmt or not (OUTPUT_DIR / entry["output"]).exists():
+        return False
+    
+    stat = pdf_path.stat()
+    if stat.st_size != entry["size"]:
+        return False
+    if stat.st_mtime == entry["mtime"]:
+        return True
+    
+    if file_sha256(pdf_path) != entry["sha256"]:
+        return False
+    entry["mtime"] = stat.st_mtime
+    return True
+
+
+def process_pdf(pdf_path: Path, page_workers: int = 1, executor: Optional[ProcessPoolExecutor] = None, timeout: int = 0, fmt: str = "columnar") -> Dict[str, Any]:
+    """
+    Extract features from one PDF and save them to OUTPUT_DIR.
+    
+    Args:
+        pdf_path: Path to PDF file
+        page_workers: Processes to split the pages across
+        executor: Pool for page shards to reuse across PDFs
+        timeout: Seconds after which the PDF is abandoned (0 = no limit)
+        fmt: Output format, "columnar" or "json"
         
+    Returns:
+        Manifest entry for the PDF
+    """
+    # Create relative path for ID
+    rel_path = pdf_path.relative_to(PDFS_DIR)
+    pdf_id = str(rel_path).replace("/", "_").replace(".pdf", "")
+    stat = pdf_path.stat()
+    
+    # Extract features
+    with time_limit(timeout):
+        features = extract_text_blocks(pdf_path, page_workers=page_workers, executor=executor)
+    
+    # Add metadata
+    features["pdf_id"] = pdf_id
+    features["pdf_path"] = str(pdf_path)
+    features["file_name"] = pdf_path.name
+    
+    # Saved atomically, so a crash never leaves a partial output
+    output_path = save_document(OUTPUT_DIR, pdf_id, features, fmt)
+    
+    return {
+        "path": str(rel_path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": file_sha256(pdf_path),
+        "output": output_path.name,
+        "format": fmt,
+    }
+
+
+def _process_pdf_task(pdf_path: Path, timeout: int, fmt: str) -> Tuple[Path, Optional[Dict[str, Any]], Optional[str]]:
+    """Worker entry point: (path, manifest entry, error)."""
+    try:
+        return pdf_path, process_pdf(pdf_path, timeout=timeout, fmt=fmt), None
     except Exception as e:
-        print(f"Error processing {pdf_path}: {e}")
-        return {"blocks": [], "page_texts": [], "total_pages": 0}
+        return pdf_path, None, str(e)
 
 
-def process_all_pdfs():
-    """Process all PDFs in the rules_pdfs directory."""
+def process_all_pdfs(page_workers: int = 1, workers: int = 1, timeout: int = 0, force: bool = False, fmt: str = "columnar"):
+    """
+    Process all PDFs in the rules_pdfs directory.
+    
+    PDFs that were processed before and haven't changed since (per the
+    manifest) are skipped, so re-runs only process new or modified files
+    and an interrupted run picks up where it stopped.
+    
+    Args:
+        page_workers: Processes to split each PDF's pages across (serial mode only)
+        workers: Processes that each handle whole PDFs (1 = serial)
+        timeout: Seconds after which a PDF is abandoned (0 = no limit)
+        force: Reprocess every PDF regardless of the manifest
+        fmt: Output format, "columnar" (memory-mappable columns) or "json"
+    """
     print("🔍 Finding all PDFs...")
     
     pdf_files = list(PDFS_DIR.rglob("*.pdf"))
     print(f"Found {len(pdf_files)} PDF files")
     
+    manifest = {} if force else load_manifest()
+    pending = [
+        pdf_path for pdf_path in pdf_files
+        if not is_unchanged(pdf_path, manifest.get(str(pdf_path.relative_to(PDFS_DIR))), fmt)
+    ]
+    skipped_count = len(pdf_files) - len(pending)
+    if skipped_count:
+        print(f"Skipping {skipped_count} unchanged PDFs")
+    
     print("\n📄 Processing PDFs...")
     processed_count = 0
     error_count = 0
     
-    for pdf_path in tqdm(pdf_files, desc="Processing"):
-        try:
-            # Create relative path for ID
-            rel_path = pdf_path.relative_to(PDFS_DIR)
-            pdf_id = str(rel_path).replace("/", "_").replace(".pdf", "")
-            
-            # Extract features
-            features = extract_text_blocks(pdf_path)
-            
-            # Add metadata
-            features["pdf_id"] = pdf_id
-            features["pdf_path"] = str(pdf_path)
-            features["file_name"] = pdf_path.name
-            
-            # Save to JSON
-            output_file = OUTPUT_DIR / f"{pdf_id}.json"
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump(features, f, indent=2, ensure_ascii=False)
+    with open(MANIFEST_FILE, "a", encoding="utf-8") as manifest_log:
+        def record(pdf_path: Path, entry: Optional[Dict[str, Any]], error: Optional[str]):
+            nonlocal processed_count, error_count
+            if error is not None:
+                print(f"\n❌ Error processing {pdf_path}: {error}")
+                error_count += 1
+                return
             
+            manifest[entry["path"]] = entry
+            manifest_log.write(json.dumps(entry) + "\n")
+            manifest_log.flush()
             processed_count += 1
+        
+        if workers > 1:
+            # Whole PDFs per process; page sharding would nest pools
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_process_pdf_task, pdf_path, timeout, fmt) for pdf_path in pending]
+                for future in tqdm(as_completed(futures), total=len(futures), desc="Processing"):
+                    record(*future.result())
+        else:
+            # One pool for page shards, shared by every PDF
+            executor = ProcessPoolExecutor(max_workers=page_workers) if page_workers > 1 else None
+            
+            for pdf_path in tqdm(pending, desc="Processing"):
+                try:
+                    record(pdf_path, process_pdf(pdf_path, page_workers, executor, timeout, fmt), None)
+                except FileTimeoutError as e:
+                    record(pdf_path, None, str(e))
+                    if executor is not None:
+                        # Shards of the abandoned PDF may still be running; start fresh workers
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        executor = ProcessPoolExecutor(max_workers=page_workers)
+                except Exception as e:
+                    record(pdf_path, None, str(e))
             
-        except Exception as e:
-            print(f"\n❌ Error processing {pdf_path}: {e}")
-            error_count += 1
+            if executor is not None:
+                executor.shutdown()
+    
+    # Compact the log to the latest entry per PDF
+    save_manifest(manifest)
     
     print(f"\n✅ Processing complete!")
     print(f"   Processed: {processed_count}")
+    print(f"   Skipped (unchanged): {skipped_count}")
     print(f"   Errors: {error_count}")
     print(f"   Output directory: {OUTPUT_DIR}")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract text blocks from rulebook PDFs")
+    parser.add_argument("--page-workers", type=int, default=1,
+                        help="Processes to split each PDF's pages across (default: 1)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes that each handle whole PDFs; overrides --page-workers (default: 1)")
+    parser.add_argument("--timeout", type=int, default=600,
+                        help="Seconds after which a PDF is abandoned, 0 for no limit (default: 600)")
+    parser.add_argument("--force", action="store_true",
+                        help="Reprocess every PDF, ignoring the manifest")
+    parser.add_argument("--format", choices=FORMATS, default="columnar",
+                        help="Output format (default: columnar)")
+    args = parser.parse_args()
+    
     if not PDFS_DIR.exists():
         print(f"❌ PDFs directory not found: {PDFS_DIR}")
         print("   Make sure Training/rules_pdfs exists")
         sys.exit(1)
     
-    process_all_pdfs()
+    process_all_pdfs(page_workers=args.page_workers, workers=args.workers, timeout=args.timeout, force=args.force, fmt=args.format)
 
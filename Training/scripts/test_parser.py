@@ -11,7 +11,7 @@ import json
 # Add parent directories to path
 sys.path.append(str(Path(__file__).parent.parent.parent / "pdf-processor"))
 
-from pdf_extractor import extract_pdf_structure
+from pdf_extractor import extract_pdf_structure, open_local_pdf
 from rule_parser import parse_rules
 
 # Test PDFs
@@ -34,7 +34,8 @@ def test_parser(pdf_path: Path):
     try:
         # Extract structure
         print("📄 Extracting PDF structure...")
-        pdf_structure = extract_pdf_structure(str(pdf_path))
+        with open_local_pdf(pdf_path) as pdf_file:
+            pdf_structure = extract_pdf_structure(str(pdf_path), pdf_file=pdf_file)
         
         print(f"   Pages: {pdf_structure.get('total_pages', 0)}")
         print(f"   Blocks: {len(pdf_structure.get('pages_data', []))}")
@@ -5,8 +5,10 @@ Trains three models:
 1. Section Detection (binary classification)
 2. Rule Classification (multi-class)
 3. Section Type Classification (multi-class)
+or, with --multitask, one shared encoder with a head for each.
 """
 
+import argparse
 import json
 import torch
 from pathlib import Path
@@ -20,6 +22,11 @@ from datasets import Dataset
 from tqdm import tqdm
 import sys
 
+# Add pdf-processor to path for the multi-task model shared with serving
+sys.path.append(str(Path(__file__).parent.parent.parent / "pdf-processor"))
+
+from multitask_model import MultiTaskClassifier, TASK_IDS
+
 MODELS_DIR = Path(__file__).parent.parent / "models"
 DATA_DIR = Path(__file__).parent.parent / "data" / "splits"
 
@@ -28,12 +35,27 @@ BASE_MODEL = "distilbert-base-uncased"  # Faster, smaller, good for production
 # Alternative: "bert-base-uncased" or "roberta-base" for better accuracy
 
 
+def load_examples(data_file: Path) -> list:
+    """
+    Load examples written by dataset_builder.py.
+    
+    Args:
+        data_file: JSONL file (one example per line) or a JSON list
+        
+    Returns:
+        List of examples
+    """
+    with open(data_file, "r", encoding="utf-8") as f:
+        if data_file.suffix != ".jsonl":
+            return json.load(f)
+        return [json.loads(line) for line in f if line.strip()]
+
+
 class SectionDetectionDataset:
     """Dataset for section heading detection."""
     
     def __init__(self, data_file: Path, tokenizer, max_length=128):
-        with open(data_file, "r") as f:
-            self.data = json.load(f)
+        self.data = load_examples(data_file)
         self.tokenizer = tokenizer
         self.max_length = max_length
     
@@ -66,8 +88,7 @@ class RuleClassificationDataset:
     """Dataset for rule classification."""
     
     def __init__(self, data_file: Path, tokenizer, max_length=256):
-        with open(data_file, "r") as f:
-            self.data = json.load(f)
+        self.data = load_examples(data_file)
         self.tokenizer = tokenizer
         self.max_length = max_length
     
@@ -102,8 +123,7 @@ class SectionTypeDataset:
     """Dataset for section type classification."""
     
     def __init__(self, data_file: Path, tokenizer, max_length=256):
-        with open(data_file, "r") as f:
-            self.data = json.load(f)
+        self.data = load_examples(data_file)
         self.tokenizer = tokenizer
         self.max_length = max_length
     
@@ -166,8 +186,8 @@ def train_section_detector():
     )
     
     # Load datasets
-    train_file = DATA_DIR / "section_detection_train.json"
-    val_file = DATA_DIR / "section_detection_val.json"
+    train_file = DATA_DIR / "section_detection_train.jsonl"
+    val_file = DATA_DIR / "section_detection_val.jsonl"
     
     if not train_file.exists() or not val_file.exists():
         print(f"❌ Dataset files not found. Run dataset_builder.py first.")
@@ -234,8 +254,8 @@ def train_rule_classifier():
     )
     
     # Load datasets
-    train_file = DATA_DIR / "rule_classification_train.json"
-    val_file = DATA_DIR / "rule_classification_val.json"
+    train_file = DATA_DIR / "rule_classification_train.jsonl"
+    val_file = DATA_DIR / "rule_classification_val.jsonl"
     
     if not train_file.exists() or not val_file.exists():
         print(f"❌ Dataset files not found. Run dataset_builder.py first.")
@@ -302,8 +322,8 @@ def train_section_classifier():
     )
     
     # Load datasets
-    train_file = DATA_DIR / "section_type_train.json"
-    val_file = DATA_DIR / "section_type_val.json"
+    train_file = DATA_DIR / "section_type_train.jsonl"
+    val_file = DATA_DIR / "section_type_val.jsonl"
     
     if not train_file.exists() or not val_file.exists():
         print(f"❌ Dataset files not found. Run dataset_builder.py first.")
@@ -353,7 +373,153 @@ def train_section_classifier():
     print(f"\n✅ Model saved to {model_dir}")
 
 
-def train_all_models():
+class MultiTaskDataset:
+    """Examples of all three tasks, each tagged with its task id."""
+    
+    def __init__(self, datasets):
+        """
+        Args:
+            datasets: Mapping of task name to that task's dataset
+        """
+        self.datasets = datasets
+        self.index = [
+            (task, i) for task, dataset in datasets.items() for i in range(len(dataset))
+        ]
+    
+    def __len__(self):
+        return len(self.index)
+    
+    def __getitem__(self, idx):
+        task, i = self.index[idx]
+        item = dict(self.datasets[task][i])
+        item["task_ids"] = torch.tensor(TASK_IDS[task], dtype=torch.long)
+        return item
+
+
+class MultiTaskCollator:
+    """Stack mixed-task examples, trimming padding to the longest one in the batch."""
+    
+    def __init__(self, pad_token_id: int):
+        self.pad_token_id = pad_token_id
+    
+    def _fit(self, tensor, length, value):
+        tensor = tensor[:length]
+        return torch.nn.functional.pad(tensor, (0, length - tensor.size(0)), value=value)
+    
+    def __call__(self, features):
+        length = max(int(f["attention_mask"].sum()) for f in features)
+        return {
+            "input_ids": torch.stack([self._fit(f["input_ids"], length, self.pad_token_id) for f in features]),
+            "attention_mask": torch.stack([self._fit(f["attention_mask"], length, 0) for f in features]),
+            "labels": torch.stack([f["labels"] for f in features]),
+            "task_ids": torch.stack([f["task_ids"] for f in features]),
+        }
+
+
+def compute_multitask_metrics(eval_pred):
+    """Compute per-task metrics; f1 is the mean over tasks."""
+    predictions, (labels, task_ids) = eval_pred
+    predictions = np.argmax(predictions, axis=1)
+    
+    metrics = {}
+    f1_scores = []
+    for task, task_id in TASK_IDS.items():
+        rows = task_ids == task_id
+        if not rows.any():
+            continue
+        
+        precision, recall, f1, _ = precision_recall_fscore_support(
+            labels[rows], predictions[rows], average="weighted", zero_division=0
+        )
+        metrics[f"{task}_accuracy"] = accuracy_score(labels[rows], predictions[rows])
+        metrics[f"{task}_f1"] = f1
+        f1_scores.append(f1)
+    
+    metrics["f1"] = float(np.mean(f1_scores)) if f1_scores else 0.0
+    return metrics
+
+
+def train_multitask_model():
+    """Train one shared encoder with a head per task."""
+    print("\n" + "="*60)
+    print("Training Multi-Task Model")
+    print("="*60)
+    
+    model_dir = MODELS_DIR / "multitask"
+    model_dir.mkdir(parents=True, exist_ok=True)
+    
+    # Load tokenizer and model
+    tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL)
+    model = MultiTaskClassifier.from_base(BASE_MODEL)
+    
+    # Load datasets
+    dataset_classes = {
+        "section_detection": SectionDetectionDataset,
+        "rule_classification": RuleClassificationDataset,
+        "section_type": SectionTypeDataset,
+    }
+    train_datasets = {}
+    val_datasets = {}
+    for task, dataset_class in dataset_classes.items():
+        train_file = DATA_DIR / f"{task}_train.jsonl"
+        val_file = DATA_DIR / f"{task}_val.jsonl"
+        
+        if not train_file.exists() or not val_file.exists():
+            print(f"⚠️  Skipping {task}: dataset files not found")
+            continue
+        
+        train_datasets[task] = dataset_class(train_file, tokenizer)
+        val_datasets[task] = dataset_class(val_file, tokenizer)
+        print(f"{task}: {len(train_datasets[task])} training, {len(val_datasets[task])} validation examples")
+    
+    if not train_datasets:
+        print(f"❌ Dataset files not found. Run dataset_builder.py first.")
+        return
+    
+    train_dataset = MultiTaskDataset(train_datasets)
+    val_dataset = MultiTaskDataset(val_datasets)
+    
+    # Training arguments
+    training_args = TrainingArguments(
+        output_dir=str(model_dir),
+        num_train_epochs=3,
+        per_device_train_batch_size=16,
+        per_device_eval_batch_size=16,
+        warmup_steps=100,
+        weight_decay=0.01,
+        logging_dir=str(model_dir / "logs"),
+        logging_steps=50,
+        evaluation_strategy="epoch",
+        save_strategy="epoch",
+        load_best_model_at_end=True,
+        metric_for_best_model="f1",
+        save_total_limit=2,
+        label_names=["labels", "task_ids"],
+    )
+    
+    # Trainer
+    trainer = Trainer(
+        model=model,
+        args=training_args,
+        train_dataset=train_dataset,
+        eval_dataset=val_dataset,
+        data_collator=MultiTaskCollator(tokenizer.pad_token_id),
+        compute_metrics=compute_multitask_metrics,
+        callbacks=[EarlyStoppingCallback(early_stopping_patience=2)],
+    )
+    
+    # Train
+    print("\n🚀 Starting training...")
+    trainer.train()
+    
+    # Save
+    model.save(model_dir)
+    tokenizer.save_pretrained(model_dir)
+    
+    print(f"\n✅ Model saved to {model_dir}")
+
+
+def train_all_models(multitask: bool = False):
     """Train all models."""
     print("🤖 Training ML Models")
     print("="*60)
@@ -365,10 +531,13 @@ def train_all_models():
         print("   Run dataset_builder.py first")
         return
     
-    # Train each model
-    train_section_detector()
-    train_rule_classifier()
-    train_section_classifier()
+    if multitask:
+        train_multitask_model()
+    else:
+        # Train each model
+        train_section_detector()
+        train_rule_classifier()
+        train_section_classifier()
     
     print("\n" + "="*60)
     print("✅ All models trained!")
@@ -376,5 +545,10 @@ def train_all_models():
 
 
 if __name__ == "__main__":
-    train_all_models()
+    parser = argparse.ArgumentParser(description="Train the PDF rule extraction models")
+    parser.add_argument("--multitask", action="store_true",
+                        help="Train one shared encoder with three heads instead of three models")
+    args = parser.parse_args()
+    
+    train_all_models(multitask=args.multitask)
 
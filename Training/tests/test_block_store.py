@@ -0,0 +1,58 @@
+import pytest
+
+from block_store import save_document, load_document, load_columns
+
+
+def test_columnar_round_trip_keeps_types_and_missing_values(tmp_path):
+    document = {
+        "pdf_id": "game_rules",
+        "total_pages": 2,
+        "blocks": [
+            {"text": "Setup", "page": 1, "font_size": 14.5, "is_bold": True, "section_type": "setup", "bbox": [1, 2, 3, 4], "extra": {"a": 1}},
+            {"text": "Shuffle the deck.", "page": None, "font_size": None, "is_bold": None, "section_type": None, "bbox": None, "extra": "note"},
+            {"text": "", "page": 2, "font_size": 10, "is_bold": False, "section_type": "setup", "bbox": [], "extra": None},
+        ],
+    }
+    
+    path = save_document(tmp_path, "game_rules", document)
+    
+    assert load_document(path) == document
+    loaded = load_document(path)
+    assert type(loaded["blocks"][0]["page"]) is int
+    assert type(loaded["blocks"][2]["is_bold"]) is bool
+    
+    _, row_count, columns = load_columns(path, "blocks", ["page", "extra"])
+    assert row_count == 3
+    assert list(columns["page"]) == [1, None, 2]
+    assert columns["extra"][0] == {"a": 1}
+
+
+def test_columnar_round_trip_keeps_absent_keys_absent(tmp_path):
+    document = {
+        "blocks": [
+            {"text": "Setup", "section_type": "setup", "page": 1},
+            {"text": "Shuffle the deck.", "page": None},
+            {"text": "Deal five cards."},
+        ],
+    }
+    
+    path = save_document(tmp_path, "ragged", document)
+    
+    assert load_document(path) == document
+    assert type(load_document(path)["blocks"][0]["page"]) is int
+
+
+def test_columnar_round_trip_keeps_ints_beyond_int64(tmp_path):
+    document = {"blocks": [{"id": 2 ** 70}, {"id": -1}, {"id": None}, {"id": 2.5}]}
+    
+    path = save_document(tmp_path, "big", document)
+    
+    assert load_document(path) == document
+    assert type(load_document(path)["blocks"][0]["id"]) is int
+
+
+def test_columnar_rejects_values_that_cannot_be_stored(tmp_path):
+    document = {"blocks": [{"text": "Setup", "value": object()}]}
+    
+    with pytest.raises(TypeError):
+        save_document(tmp_path, "broken", document)
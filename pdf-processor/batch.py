@@ -0,0 +1,137 @@
+"""
+Batch document processing.
+Processes several rulebooks of one request together. PDFs are downloaded,
+extracted, analyzed and parsed in parallel across the worker pool, while each
+model runs once over the inputs of all documents (in shared batches) and its
+predictions are handed to the per-document steps.
+"""
+
+import asyncio
+import os
+from typing import Dict, Any, List, Optional
+
+from worker_pool import (
+    extract_document, predict_document_headings, predict_document_section_types,
+    analyze_document, parse_document, run_in_pool, QueueFullError
+)
+from pdf_extractor import ml_available
+from rule_parser import section_type_queries
+
+# Most PDFs accepted in one batch request
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 20))
+# Seconds a batch step waits for queue space before its PDF fails with 503
+BATCH_QUEUE_WAIT_SECONDS = float(os.getenv("BATCH_QUEUE_WAIT_SECONDS", 30))
+
+
+async def _run_when_free(fn, *args):
+    """
+    Run fn in the worker pool, waiting up to BATCH_QUEUE_WAIT_SECONDS for
+    queue space.
+    
+    Raises:
+        QueueFullError: If the queue stayed full for the whole wait
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + BATCH_QUEUE_WAIT_SECONDS
+    while True:
+        try:
+            return await run_in_pool(fn, *args)
+        except QueueFullError:
+            if loop.time() >= deadline:
+                raise
+            await asyncio.sleep(min(1, max(0, deadline - loop.time())))
+
+
+async def _predict(predict, queries: List[List[Dict[str, Any]]]) -> List[Optional[List[Dict[str, Any]]]]:
+    """
+    Run a batched prediction over every document's queries in one pool task.
+    
+    Returns None per document if the models can't be used, so each document
+    falls back to predicting (or pattern matching) on its own.
+    """
+    if not queries or not ml_available():
+        return [None] * len(queries)
+    
+    try:
+        return await _run_when_free(predict, queries)
+    except Exception as e:
+        print(f"ML prediction error: {e}")
+        return [None] * len(queries)
+
+
+async def process_batch(pdf_urls: List[str]) -> List[Dict[str, Any]]:
+    """
+    Process several PDFs, sharing model inference across them.
+    
+    A failing PDF doesn't fail the batch; its outcome carries the error and
+    an HTTP status (503 if the queue stayed full, 500 otherwise).
+    
+    Args:
+        pdf_urls: URLs to the PDF files
+    
+    Returns:
+        {"result"} with sections and metadata, or {"error", "status"}, per
+        URL in order
+    """
+    outcomes: List[Optional[Dict[str, Any]]] = [None] * len(pdf_urls)
+    
+    def failed(i: int, error: BaseException):
+        if isinstance(error, QueueFullError):
+            outcomes[i] = {"error": str(error), "status": 503}
+        else:
+            outcomes[i] = {"error": f"Failed to process PDF: {str(error)}", "status": 500}
+    
+    extracted = await asyncio.gather(
+        *(_run_when_free(extract_document, url) for url in pdf_urls),
+        return_exceptions=True,
+    )
+    
+    pending = []
+    for i, item in enumerate(extracted):
+        if isinstance(item, BaseException):
+            failed(i, item)
+        elif "result" in item:
+            outcomes[i] = item
+        else:
+            pending.append((i, item))
+    
+    # Section headings: one model run over all documents, then analysis per document
+    heading_predictions = await _predict(predict_document_headings, [item["heading_queries"] for _, item in pending])
+    structures = await asyncio.gather(
+        *(
+            _run_when_free(analyze_document, item["pdf_structure"]["pages_data"], predictions)
+            for (_, item), predictions in zip(pending, heading_predictions)
+        ),
+        return_exceptions=True,
+    )
+    
+    analyzed = []
+    for (i, item), structure in zip(pending, structures):
+        if isinstance(structure, BaseException):
+            failed(i, structure)
+        else:
+            # Parsing doesn't need the text runs, so they aren't sent to a worker again
+            item["pdf_structure"] = dict(item["pdf_structure"], structure=structure)
+            del item["pdf_structure"]["pages_data"]
+            analyzed.append((i, item))
+    
+    # Section types: one model run over all documents, then parsing per document
+    type_predictions = await _predict(
+        predict_document_section_types,
+        [section_type_queries(item["pdf_structure"]["structure"]["headings"]) for _, item in analyzed],
+    )
+    results = await asyncio.gather(
+        *(
+            _run_when_free(parse_document, item["key"], item["pdf_structure"], predictions)
+            for (_, item), predictions in zip(analyzed, type_predictions)
+        ),
+        return_exceptions=True,
+    )
+    
+    for (i, _), result in zip(analyzed, results):
+        if isinstance(result, BaseException):
+            failed(i, result)
+        else:
+            outcomes[i] = {"result": result}
+    
+    return outcomes
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark heading detection in analyze_structure.
+Times synthetic documents from 1k to 100k text blocks to check that the
+analysis scales linearly with block count.
+
+Usage:
+    python benchmarks/bench_analyze_structure.py
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from pdf_extractor import TextRun, analyze_structure
+
+BLOCK_COUNTS = [1_000, 10_000, 100_000]
+BLOCKS_PER_PAGE = 50
+
+
+def make_pages(block_count: int):
+    """Build pages_data with a mix of body text, bold text and headings."""
+    rng = random.Random(block_count)
+    pages_data = []
+    for page_start in range(0, block_count, BLOCKS_PER_PAGE):
+        page = page_start // BLOCKS_PER_PAGE + 1
+        runs = []
+        for i in range(min(BLOCKS_PER_PAGE, block_count - page_start)):
+            roll = rng.random()
+            if roll < 0.03:
+                run = TextRun("SETUP AND COMPONENTS", 18.0, True, page, 40, i * 12, 300, i * 12 + 18)
+            elif roll < 0.1:
+                run = TextRun("Important:", 10.0, True, page, 40, i * 12, 90, i * 12 + 10)
+            else:
+                run = TextRun("each player draws two cards and places one face down in front of them",
+                              10.0, False, page, 40, i * 12, 500, i * 12 + 10)
+            runs.append(run)
+        pages_data.append({"page": page, "text": "", "runs": runs})
+    return pages_data
+
+
+def main():
+    print(f"{'blocks':>10} {'seconds':>10} {'us/block':>10}")
+    per_block = []
+    for block_count in BLOCK_COUNTS:
+        pages_data = make_pages(block_count)
+        start = time.perf_counter()
+        structure = analyze_structure(pages_data, use_ml=False)
+        elapsed = time.perf_counter() - start
+        per_block.append(elapsed / block_count)
+        print(f"{block_count:>10} {elapsed:>10.3f} {elapsed / block_count * 1e6:>10.2f}"
+              f"   ({len(structure['headings'])} headings)")
+
+    # Linear scaling keeps per-block cost roughly flat across sizes
+    growth = per_block[-1] / per_block[0]
+    print(f"\nPer-block cost growth {BLOCK_COUNTS[0]} -> {BLOCK_COUNTS[-1]}: {growth:.2f}x")
+    if growth > 3:
+        print("❌ Per-block cost grows with document size (super-linear)")
+        sys.exit(1)
+    print("✅ Scales linearly")
+
+
+if __name__ == "__main__":
+    main()
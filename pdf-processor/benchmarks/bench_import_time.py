@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark service import time.
+Imports main in a fresh interpreter with `python -X importtime`, reports the
+total and the slowest modules, and fails if a heavy library (numpy, ML stack or PDF
+parsers) is imported at startup instead of on first use.
+
+Usage:
+    python benchmarks/bench_import_time.py [--module main] [--top 15] [--max-ms 1500]
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).parent.parent
+
+# Must not be imported until a document actually needs them
+LAZY_MODULES = ["numpy", "torch", "transformers", "onnxruntime", "fitz", "pdfplumber"]
+
+
+def measure(module: str):
+    """
+    Import module in a fresh interpreter.
+
+    Returns:
+        List of (module name, self µs, cumulative µs) in import order
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SERVICE_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr)
+        sys.exit(result.returncode)
+
+    timings = []
+    for line in result.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark service import time")
+    parser.add_argument("--module", default="main", help="Module to import (default: main)")
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to list (default: 15)")
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail if the import takes longer")
+    args = parser.parse_args()
+
+    timings = measure(args.module)
+    total_ms = next(cumulative for name, _, cumulative in timings if name == args.module) / 1000
+
+    # Slowest modules by their own import time (excluding their imports)
+    print(f"{'self ms':>10} {'cumulative ms':>14}  module")
+    for name, self_us, cumulative_us in sorted(timings, key=lambda t: -t[1])[:args.top]:
+        print(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>14.1f}  {name.strip()}")
+
+    print(f"\nimport {args.module}: {total_ms:.1f} ms")
+
+    failed = False
+    imported = {name.strip().split(".")[0] for name, _, _ in timings}
+    eager = [name for name in LAZY_MODULES if name in imported]
+    if eager:
+        print(f"❌ Imported at startup: {', '.join(eager)}")
+        failed = True
+
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"❌ Import took longer than {args.max_ms:.0f} ms")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("✅ Heavy libraries are imported lazily")
+
+
+if __name__ == "__main__":
+    main()
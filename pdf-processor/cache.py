@@ -0,0 +1,159 @@
+"""
+Content-addressed cache for processed PDFs.
+Results are keyed on the PDF's SHA-256 plus parser and model versions, held
+in a small in-memory LRU and persisted to a size-bounded directory on disk.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from pdf_extractor import EXTRACTION_BACKEND
+from rule_parser import PARSER_VERSION, ML_MODELS_AVAILABLE
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_DIR = Path(os.getenv("RESULT_CACHE_DIR", "/tmp/ludex-result-cache"))
+# Disk tier size limit; least recently used results are evicted beyond it
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# Results kept in memory in front of the disk tier
+RESULT_CACHE_MEMORY_ITEMS = int(os.getenv("RESULT_CACHE_MEMORY_ITEMS", 64))
+# Writes between directory rescans, which pick up what other workers wrote or evicted
+RESCAN_INTERVAL = 64
+# Eviction frees space down to this share of the limit, so the next writes don't rescan
+EVICT_TO = 0.9
+
+
+def result_key(pdf_sha256: str) -> str:
+    """
+    Build the cache key for a PDF.
+    
+    Args:
+        pdf_sha256: Hex SHA-256 digest of the PDF bytes
+    
+    Returns:
+        Hex digest combining the PDF hash with extraction backend, parser and model versions
+    """
+    model_version = "none"
+    if ML_MODELS_AVAILABLE:
+        from ml_models import get_model_version
+        model_version = get_model_version()
+    
+    key = f"{pdf_sha256}:{EXTRACTION_BACKEND}:{PARSER_VERSION}:{model_version}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class ResultCache:
+    """Two-tier (memory, then disk) LRU cache of processing results."""
+    
+    def __init__(self, directory: Path, max_bytes: int, memory_items: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Disk tier size as last scanned plus this worker's writes since
+        self._disk_bytes = None
+        self._writes_since_scan = 0
+    
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+    
+    def _remember(self, key: str, value: Dict[str, Any]):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                return value
+        
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            # Mark as recently used for disk eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        
+        self._remember(key, value)
+        return value
+    
+    def put(self, key: str, value: Dict[str, Any]):
+        self._remember(key, value)
+        
+        # Write atomically so other workers never read a partial file
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        try:
+            data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Result cache write error: {e}")
+            return
+        
+        with self._lock:
+            self._writes_since_scan += 1
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(data)
+                # Rescan only once the tracked size crosses the limit, or every RESCAN_INTERVAL writes
+                if self._disk_bytes <= self.max_bytes and self._writes_since_scan < RESCAN_INTERVAL:
+                    return
+            self._evict()
+    
+    def _evict(self):
+        """Delete least recently used files until the disk tier fits (called with the lock held)."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+        
+        self._disk_bytes = total
+        self._writes_since_scan = 0
+
+
+_cache = None
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Get the process-wide result cache, or None if caching is disabled."""
+    global _cache
+    
+    if not RESULT_CACHE_ENABLED:
+        return None
+    
+    if _cache is None:
+        _cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MEMORY_ITEMS)
+    
+    return _cache
@@ -0,0 +1,237 @@
+"""
+Asynchronous processing jobs.
+Stores job status, page progress and results so clients can submit a PDF and
+poll for the outcome instead of holding the HTTP connection open.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional
+
+from worker_pool import (
+    process_document, run_in_pool, subscribe, unsubscribe,
+    WORKER_COUNT, QueueFullError
+)
+
+# "memory" keeps jobs in this process, "sqlite" persists them to JOB_DB_PATH
+JOB_STORE = os.getenv("JOB_STORE", "memory")
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+# Finished jobs are removed after this many seconds
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", 24 * 60 * 60))
+
+# Jobs wait here for a worker instead of being rejected like /process
+_job_slots = None
+# Running job tasks (kept referenced so they aren't garbage collected)
+_tasks = set()
+
+
+def _new_job(job_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the initial record for a queued job."""
+    now = time.time()
+    return {
+        "jobId": job_id,
+        "status": "queued",
+        "request": request,
+        "progress": {"page": 0, "totalPages": 0},
+        "result": None,
+        "error": None,
+        "createdAt": now,
+        "updatedAt": now,
+    }
+
+
+class InMemoryJobStore:
+    """Job store backed by a dictionary (lost on restart)."""
+    
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def create(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        job = _new_job(uuid.uuid4().hex, request)
+        with self._lock:
+            self._jobs[job["jobId"]] = job
+        return dict(job)
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+    
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.update(fields, updatedAt=time.time())
+    
+    def prune(self, max_age: float):
+        cutoff = time.time() - max_age
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in ("completed", "failed") and job["updatedAt"] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+    
+    def fail_unfinished(self):
+        pass  # Nothing survives a restart
+
+
+class SQLiteJobStore:
+    """Job store backed by a SQLite database file."""
+    
+    COLUMNS = ("jobId", "status", "request", "progress", "result", "error", "createdAt", "updatedAt")
+    JSON_COLUMNS = ("request", "progress", "result")
+    
+    def __init__(self, db_path: str):
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    jobId TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    request TEXT,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    createdAt REAL,
+                    updatedAt REAL
+                )
+                """
+            )
+    
+    def _row_to_job(self, row) -> Dict[str, Any]:
+        job = dict(zip(self.COLUMNS, row))
+        for column in self.JSON_COLUMNS:
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+    
+    def create(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        job = _new_job(uuid.uuid4().hex, request)
+        values = [
+            json.dumps(job[c]) if c in self.JSON_COLUMNS and job[c] is not None else job[c]
+            for c in self.COLUMNS
+        ]
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                values,
+            )
+        return job
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE jobId = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+    
+    def update(self, job_id: str, **fields):
+        fields["updatedAt"] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        values = [
+            json.dumps(value) if column in self.JSON_COLUMNS and value is not None else value
+            for column, value in fields.items()
+        ]
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE jobId = ?", values + [job_id]
+            )
+    
+    def prune(self, max_age: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('completed', 'failed') AND updatedAt < ?",
+                (time.time() - max_age,),
+            )
+    
+    def fail_unfinished(self):
+        """Mark jobs left running by a previous process as failed."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updatedAt = ? "
+                "WHERE status IN ('queued', 'processing')",
+                ("Interrupted by service restart", time.time()),
+            )
+
+
+def create_job_store():
+    """Create the job store selected by JOB_STORE."""
+    if JOB_STORE == "sqlite":
+        return SQLiteJobStore(JOB_DB_PATH)
+    return InMemoryJobStore()
+
+
+async def run_job(store, job_id: str, pdf_url: str):
+    """
+    Process a submitted PDF and record progress and the outcome in the store.
+    
+    Args:
+        store: Job store holding the job
+        job_id: Job to run
+        pdf_url: URL to the PDF file
+    """
+    global _job_slots
+    if _job_slots is None:
+        _job_slots = asyncio.Semaphore(WORKER_COUNT)
+    
+    def on_event(event: Dict[str, Any]):
+        if event.get("event") == "progress":
+            store.update(job_id, progress={
+                "page": event["page"],
+                "totalPages": event["totalPages"],
+            })
+    
+    async with _job_slots:
+        store.update(job_id, status="processing")
+        subscribe(job_id, on_event)
+        try:
+            while True:
+                try:
+                    result = await run_in_pool(process_document, pdf_url, job_id)
+                    break
+                except QueueFullError:
+                    # Synchronous requests hold the queue; try again shortly
+                    await asyncio.sleep(1)
+            
+            store.update(job_id, status="completed", result={
+                "success": True,
+                "sections": result["sections"],
+                "metadata": result["metadata"],
+            })
+        except Exception as e:
+            store.update(job_id, status="failed", error=f"Failed to process PDF: {str(e)}")
+        finally:
+            unsubscribe(job_id)
+
+
+def start_job(store, request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Create a job and schedule it on the running event loop.
+    
+    Args:
+        store: Job store to record the job in
+        request: ProcessRequest fields
+    
+    Returns:
+        The queued job record
+    """
+    store.prune(JOB_TTL_SECONDS)
+    job = store.create(request)
+    
+    task = asyncio.get_running_loop().create_task(
+        run_job(store, job["jobId"], request["pdfUrl"])
+    )
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    
+    return job
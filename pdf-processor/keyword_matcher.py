@@ -0,0 +1,93 @@
+"""
+Single-pass keyword matching for section vocabularies.
+Compiles a keyword list into one trie-shaped regular expression, so text is
+scanned once no matter how many keywords (or languages) the vocabulary holds.
+Shared by rule_parser and the training auto-labeler.
+"""
+
+import re
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+
+def _trie_pattern(node: Dict[str, Any]) -> str:
+    """
+    Build a regex fragment for a trie node.
+    
+    Longer continuations are tried first, so each match is the longest
+    keyword starting at that position.
+    """
+    terminal = "" in node
+    children = [(char, child) for char, child in node.items() if char != ""]
+    children.sort(key=lambda item: -_depth(item[1]))
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in children]
+    
+    if not branches:
+        return ""
+    
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if terminal:
+        return "(?:" + body + ")?"
+    return body
+
+
+def _depth(node: Dict[str, Any]) -> int:
+    """Length of the longest keyword below a trie node."""
+    return max((1 + _depth(child) for char, child in node.items() if char != ""), default=0)
+
+
+class KeywordMatcher:
+    """
+    Case-insensitive matcher for a keyword → label vocabulary.
+    
+    Keywords match anywhere in the text, including inside longer words
+    ("goal" in "goalkeeper"), like the substring checks this replaced;
+    section titles in extracted text are often glued to neighboring words.
+    """
+    
+    def __init__(self, keywords: Dict[str, Any]):
+        """
+        Args:
+            keywords: Mapping of keyword to label (any value, e.g. a section type)
+        """
+        self._labels: Dict[str, Any] = {}
+        self._titles: Dict[str, str] = {}
+        trie: Dict[str, Any] = {}
+        
+        for keyword, label in keywords.items():
+            key = keyword.lower()
+            if not key or key in self._labels:
+                continue  # First label for a keyword wins
+            self._labels[key] = label
+            self._titles[key] = keyword
+            
+            node = trie
+            for char in key:
+                node = node.setdefault(char, {})
+            node[""] = True
+        
+        self._pattern = re.compile(_trie_pattern(trie), re.IGNORECASE) if trie else None
+    
+    def finditer(self, text: str) -> Iterator[Tuple[int, int, str, Any]]:
+        """
+        Find non-overlapping keyword occurrences, leftmost-longest first.
+        
+        Args:
+            text: Text to scan
+        
+        Yields:
+            (start, end, keyword as given in the vocabulary, label) tuples
+        """
+        if self._pattern is None:
+            return
+        for match in self._pattern.finditer(text):
+            key = match.group().lower()
+            if key in self._labels:
+                yield match.start(), match.end(), self._titles[key], self._labels[key]
+    
+    def search(self, text: str) -> Optional[Tuple[int, int, str, Any]]:
+        """First keyword occurrence in text, or None."""
+        return next(self.finditer(text), None)
+    
+    def labels(self, text: str) -> Set[Any]:
+        """Labels of all keywords occurring in text."""
+        return {label for _, _, _, label in self.finditer(text)}
@@ -1,9 +1,17 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
 import uvicorn
 import os
-from pdf_extractor import extract_pdf_structure
-from rule_parser import parse_rules
+from worker_pool import (
+    process_document, run_in_pool, queue_stats, prediction_cache_stats, shutdown, warm_pool, readiness,
+    QueueFullError, PRELOAD_MODELS
+)
+from jobs import create_job_store, start_job
+from streaming import start_stream, encode_events
+from batch import process_batch, BATCH_MAX_ITEMS
 
 app = FastAPI(title="Ludex PDF Processor", version="1.0.0")
 
@@ -20,10 +28,70 @@ class ProcessResponse(BaseModel):
     metadata: dict
 
 
+class BatchItemResponse(BaseModel):
+    gameId: str
+    success: bool
+    status: int = 200
+    sections: Optional[list] = None
+    metadata: Optional[dict] = None
+    error: Optional[str] = None
+
+
+class BatchProcessResponse(BaseModel):
+    results: List[BatchItemResponse]
+
+
+class JobResponse(BaseModel):
+    jobId: str
+    status: str
+    progress: dict
+    result: Optional[ProcessResponse] = None
+    error: Optional[str] = None
+
+
+job_store = create_job_store()
+# Keeps the warm-up task referenced while it runs
+_warm_up_task = None
+
+
+@app.on_event("startup")
+async def recover_jobs():
+    """Fail jobs that were interrupted by a restart"""
+    job_store.fail_unfinished()
+
+
+@app.on_event("startup")
+async def preload_models():
+    """Start workers and warm up models in the background; /ready reports when done"""
+    global _warm_up_task
+    if PRELOAD_MODELS:
+        _warm_up_task = asyncio.get_running_loop().create_task(warm_pool())
+
+
+@app.on_event("shutdown")
+async def shutdown_pool():
+    """Stop worker processes with the server"""
+    shutdown()
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy"}
+    return {"status": "healthy", "queue": queue_stats(), "predictionCache": prediction_cache_stats()}
+
+
+@app.get("/ready")
+async def ready_check():
+    """Readiness endpoint: 503 until models are loaded and warmed up, or if warm-up failed"""
+    state = readiness()
+    if state["ready"]:
+        status = "ready"
+    else:
+        status = "failed" if state.get("error") else "warming"
+    return JSONResponse(
+        status_code=200 if state["ready"] else 503,
+        content={"status": status, **state},
+    )
 
 
 @app.post("/process", response_model=ProcessResponse)
@@ -33,30 +101,26 @@ async def process_pdf(request: ProcessRequest):
     
     Args:
         request: ProcessRequest with gameId, pdfUrl, and userId
-        
+    
     Returns:
         ProcessResponse with structured sections and metadata
     """
     try:
-        # Extract PDF structure
-        pdf_structure = extract_pdf_structure(request.pdfUrl)
-        
-        # Parse rules into sections
-        sections = parse_rules(pdf_structure)
-        
-        # Build metadata
-        metadata = {
-            "totalPages": pdf_structure.get("total_pages", 0),
-            "hasImages": pdf_structure.get("has_images", False),
-            "hasTables": pdf_structure.get("has_tables", False),
-        }
+        # Extract and parse in the worker pool so the event loop stays free
+        result = await run_in_pool(process_document, request.pdfUrl)
         
         return ProcessResponse(
             success=True,
-            sections=sections,
-            metadata=metadata
+            sections=result["sections"],
+            metadata=result["metadata"]
+        )
+    
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": "10"}
         )
-        
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -64,7 +128,108 @@ async def process_pdf(request: ProcessRequest):
         )
 
 
+@app.post("/process/stream")
+async def process_pdf_stream(request: ProcessRequest, accept: Optional[str] = Header(None)):
+    """
+    Process a PDF rulebook, streaming page progress and each section as it is parsed.
+    
+    Args:
+        request: ProcessRequest with gameId, pdfUrl, and userId
+        accept: "text/event-stream" for server-sent events, NDJSON otherwise
+    
+    Returns:
+        Streaming response of progress, section, done or error events
+    """
+    try:
+        events = start_stream(request.pdfUrl)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": "10"}
+        )
+    
+    sse = "text/event-stream" in (accept or "")
+    return StreamingResponse(
+        encode_events(events, sse=sse),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        # Ask proxies not to buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/process/batch", response_model=BatchProcessResponse)
+async def process_pdf_batch(requests: List[ProcessRequest]):
+    """
+    Process several PDF rulebooks in one request, sharing model inference.
+    
+    Args:
+        requests: ProcessRequests with gameId, pdfUrl, and userId
+    
+    Returns:
+        BatchProcessResponse with one result per request, in order
+    """
+    if not requests:
+        raise HTTPException(status_code=422, detail="Batch is empty")
+    if len(requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch has {len(requests)} PDFs; at most {BATCH_MAX_ITEMS} are allowed"
+        )
+    
+    outcomes = await process_batch([request.pdfUrl for request in requests])
+    
+    results = []
+    for request, outcome in zip(requests, outcomes):
+        if "error" in outcome:
+            results.append(BatchItemResponse(
+                gameId=request.gameId,
+                success=False,
+                status=outcome["status"],
+                error=outcome["error"]
+            ))
+        else:
+            results.append(BatchItemResponse(
+                gameId=request.gameId,
+                success=True,
+                sections=outcome["result"]["sections"],
+                metadata=outcome["result"]["metadata"]
+            ))
+    
+    return BatchProcessResponse(results=results)
+
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def submit_job(request: ProcessRequest):
+    """
+    Queue a PDF rulebook for processing and return immediately.
+    
+    Args:
+        request: ProcessRequest with gameId, pdfUrl, and userId
+    
+    Returns:
+        JobResponse with the job id to poll
+    """
+    return start_job(job_store, request.model_dump())
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """
+    Get status, page progress and (once completed) the result of a job.
+    
+    Args:
+        job_id: Job id returned by POST /jobs
+    
+    Returns:
+        JobResponse with status, progress, result or error
+    """
+    job = job_store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8080))
     uvicorn.run(app, host="0.0.0.0", port=port)
-
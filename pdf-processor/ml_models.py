@@ -3,14 +3,34 @@ ML Model loading and inference for PDF rule extraction.
 Loads trained models and provides prediction functions.
 """
 
-import torch
 from pathlib import Path
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from typing import Dict, List, Any, Optional
+from typing import TYPE_CHECKING, Dict, List, Any
+import hashlib
+import importlib.util
 import os
 
+from prediction_cache import get_prediction_cache, normalize_text, prediction_key
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# "torch" runs the trained PyTorch models, "onnx" runs their int8-quantized
+# ONNX exports (see Training/scripts/export_onnx.py) with ONNX Runtime
+ML_BACKEND = os.getenv("ML_BACKEND", "torch")
+
+# numpy, torch, transformers and onnxruntime are imported on first use, so that
+# importing this module (and the service) stays fast
+
+# Serve all three predictions from the shared-encoder model trained with
+# train_models.py --multitask instead of three separate models (torch backend)
+ML_MULTITASK = os.getenv("ML_MULTITASK", "false").lower() == "true"
+
 # Model paths (relative to this file)
 MODELS_BASE_DIR = Path(__file__).parent.parent / "training" / "models"
+# Quantized export written next to each model by export_onnx.py
+ONNX_MODEL_FILE = "model.int8.onnx"
+# Texts per forward pass in batched prediction
+ML_BATCH_SIZE = int(os.getenv("ML_BATCH_SIZE", 32))
 
 # Model instances (cached)
 _section_detector = None
@@ -19,12 +39,180 @@ _rule_classifier = None
 _rule_classifier_tokenizer = None
 _section_classifier = None
 _section_classifier_tokenizer = None
+_multitask_model = None
+_multitask_tokenizer = None
+_model_version = None
+# Intra-op threads per inference call (None = runtime default)
+_num_threads = None
+
+
+def get_model_version() -> str:
+    """
+    Identify the installed models, for keying cached results.
+    
+    Returns:
+        Short hash of the model files' names, sizes and modification times,
+        or "none" if no models are installed
+    """
+    global _model_version
+    
+    if _model_version is not None:
+        return _model_version
+    
+    parts = []
+    names = ("multitask",) if ML_MULTITASK else ("section_detector", "rule_classifier", "section_classifier")
+    for name in names:
+        model_dir = MODELS_BASE_DIR / name
+        if not model_dir.exists():
+            continue
+        for path in sorted(model_dir.iterdir()):
+            if path.is_file():
+                stat = path.stat()
+                parts.append(f"{name}/{path.name}:{stat.st_size}:{int(stat.st_mtime)}")
+    
+    if parts:
+        # Quantized models can predict differently from the originals
+        parts.append(f"backend:{ML_BACKEND}:{'multitask' if ML_MULTITASK else 'separate'}")
+    
+    _model_version = hashlib.sha256("|".join(parts).encode()).hexdigest()[:16] if parts else "none"
+    return _model_version
+
+
+def ml_stack_available() -> bool:
+    """
+    Whether the inference libraries for ML_BACKEND are installed.
+    
+    Checked without importing them.
+    """
+    runtime = "onnxruntime" if ML_BACKEND == "onnx" else "torch"
+    return all(importlib.util.find_spec(name) is not None for name in ("transformers", runtime))
+
+
+class OnnxSequenceClassifier:
+    """ONNX Runtime session for an exported sequence classification model."""
+    
+    def __init__(self, model_path: Path):
+        if not model_path.exists():
+            raise FileNotFoundError(f"{model_path} not found, run Training/scripts/export_onnx.py")
+        
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        if _num_threads:
+            options.intra_op_num_threads = _num_threads
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+    
+    def logits(self, batch: Dict[str, "np.ndarray"]) -> "np.ndarray":
+        import numpy as np
+        
+        inputs = {name: value.astype(np.int64) for name, value in batch.items() if name in self.input_names}
+        return self.session.run(["logits"], inputs)[0]
+
+
+def set_thread_count(threads: int):
+    """
+    Limit the threads each inference call uses.
+    
+    Call before loading models; ONNX sessions pick the setting up when created.
+    
+    Args:
+        threads: Intra-op thread count
+    """
+    global _num_threads
+    _num_threads = max(1, threads)
+    
+    if ML_BACKEND != "onnx":
+        import torch
+        torch.set_num_threads(_num_threads)
+
+
+def _load_tokenizer(model_dir: Path):
+    """Load the tokenizer saved with a model."""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_dir)
+
+
+def _load_classifier(model_dir: Path):
+    """Load the classification model in model_dir for the selected ML_BACKEND."""
+    if ML_BACKEND == "onnx":
+        return OnnxSequenceClassifier(model_dir / ONNX_MODEL_FILE)
+    
+    from transformers import AutoModelForSequenceClassification
+    
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    model.eval()
+    return model
+
+
+class TaskHead:
+    """One task's view of the shared multi-task model."""
+    
+    def __init__(self, model, task: str):
+        self.model = model
+        self.task = task
+
+
+def _logits(model, batch: Dict[str, "np.ndarray"]):
+    """Run a padded batch through any backend and return its logits."""
+    if isinstance(model, OnnxSequenceClassifier):
+        return model.logits(batch)
+    
+    import torch
+    
+    tensors = {name: torch.from_numpy(value) for name, value in batch.items()}
+    with torch.no_grad():
+        if isinstance(model, TaskHead):
+            return model.model.task_logits(model.task, **tensors).numpy()
+        return model(**tensors).logits.numpy()
+
+
+def load_multitask_model():
+    """Load the shared-encoder multi-task model."""
+    global _multitask_model, _multitask_tokenizer
+    
+    if _multitask_model is not None:
+        return _multitask_model, _multitask_tokenizer
+    
+    model_dir = MODELS_BASE_DIR / "multitask"
+    
+    if not model_dir.exists():
+        return None, None
+    
+    try:
+        if ML_BACKEND != "torch":
+            raise ValueError("the multi-task model requires ML_BACKEND=torch")
+        
+        from multitask_model import MultiTaskClassifier
+        
+        tokenizer = _load_tokenizer(model_dir)
+        model = MultiTaskClassifier.load(model_dir)
+        model.eval()
+        
+        _multitask_model = model
+        _multitask_tokenizer = tokenizer
+        
+        return model, tokenizer
+    except Exception as e:
+        print(f"Error loading multi-task model: {e}")
+        return None, None
+
+
+def _load_task_head(task: str):
+    """Get (TaskHead, tokenizer) for a task of the multi-task model."""
+    model, tokenizer = load_multitask_model()
+    if model is None:
+        return None, None
+    return TaskHead(model, task), tokenizer
 
 
 def load_section_detector():
     """Load section detection model."""
     global _section_detector, _section_detector_tokenizer
     
+    if ML_MULTITASK:
+        return _load_task_head("section_detection")
+    
     if _section_detector is not None:
         return _section_detector, _section_detector_tokenizer
     
@@ -34,9 +222,8 @@ def load_section_detector():
         return None, None
     
     try:
-        tokenizer = AutoTokenizer.from_pretrained(model_dir)
-        model = AutoModelForSequenceClassification.from_pretrained(model_dir)
-        model.eval()
+        tokenizer = _load_tokenizer(model_dir)
+        model = _load_classifier(model_dir)
         
         _section_detector = model
         _section_detector_tokenizer = tokenizer
@@ -51,6 +238,9 @@ def load_rule_classifier():
     """Load rule classification model."""
     global _rule_classifier, _rule_classifier_tokenizer
     
+    if ML_MULTITASK:
+        return _load_task_head("rule_classification")
+    
     if _rule_classifier is not None:
         return _rule_classifier, _rule_classifier_tokenizer
     
@@ -60,9 +250,8 @@ def load_rule_classifier():
         return None, None
     
     try:
-        tokenizer = AutoTokenizer.from_pretrained(model_dir)
-        model = AutoModelForSequenceClassification.from_pretrained(model_dir)
-        model.eval()
+        tokenizer = _load_tokenizer(model_dir)
+        model = _load_classifier(model_dir)
         
         _rule_classifier = model
         _rule_classifier_tokenizer = tokenizer
@@ -77,6 +266,9 @@ def load_section_classifier():
     """Load section type classification model."""
     global _section_classifier, _section_classifier_tokenizer
     
+    if ML_MULTITASK:
+        return _load_task_head("section_type")
+    
     if _section_classifier is not None:
         return _section_classifier, _section_classifier_tokenizer
     
@@ -86,9 +278,8 @@ def load_section_classifier():
         return None, None
     
     try:
-        tokenizer = AutoTokenizer.from_pretrained(model_dir)
-        model = AutoModelForSequenceClassification.from_pretrained(model_dir)
-        model.eval()
+        tokenizer = _load_tokenizer(model_dir)
+        model = _load_classifier(model_dir)
         
         _section_classifier = model
         _section_classifier_tokenizer = tokenizer
@@ -99,153 +290,277 @@ def load_section_classifier():
         return None, None
 
 
-def predict_section_heading(text: str, font_size: float = 0, is_bold: bool = False) -> Dict[str, Any]:
+TEXT_TYPE_LABELS = {0: "rule", 1: "example", 2: "explanation", 3: "other"}
+SECTION_TYPE_LABELS = {
+    0: "setup", 1: "gameplay", 2: "objective", 3: "scoring",
+    4: "end_game", 5: "advanced", 6: "examples", 7: "faq", 8: "other"
+}
+
+
+def _top_class(logits: "np.ndarray") -> tuple:
+    """Predicted class and its softmax probability per row."""
+    import numpy as np
+    
+    # Softmax, shifted for numerical stability
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    probs = exp / exp.sum(axis=1, keepdims=True)
+    return probs.argmax(axis=1).tolist(), probs.max(axis=1).tolist()
+
+
+def _classify_batch(model, tokenizer, texts: List[str], max_length: int) -> List[tuple]:
     """
-    Predict if text is a section heading.
+    Classify texts in batches with dynamic padding.
+    
+    Texts are tokenized once without padding, sorted by token length and
+    padded only to the longest text in each batch, so short blocks don't pay
+    for max_length tokens.
     
     Args:
-        text: Text to classify
-        font_size: Font size (for feature)
-        is_bold: Whether text is bold
+        model: Sequence classification model (PyTorch, ONNX or TaskHead)
+        tokenizer: Matching tokenizer
+        texts: Input texts
+        max_length: Truncation length
         
     Returns:
-        Dictionary with prediction and confidence
+        (predicted class, confidence) per text, in input order
+    """
+    encodings = tokenizer(texts, truncation=True, max_length=max_length)
+    input_ids = encodings["input_ids"]
+    attention_mask = encodings["attention_mask"]
+    
+    order = sorted(range(len(texts)), key=lambda i: len(input_ids[i]))
+    results = [None] * len(texts)
+    
+    for batch_start in range(0, len(order), ML_BATCH_SIZE):
+        batch_indices = order[batch_start:batch_start + ML_BATCH_SIZE]
+        batch = tokenizer.pad(
+            {
+                "input_ids": [input_ids[i] for i in batch_indices],
+                "attention_mask": [attention_mask[i] for i in batch_indices],
+            },
+            return_tensors="np",
+        )
+        
+        preds, confidences = _top_class(_logits(model, dict(batch)))
+        for i, pred, confidence in zip(batch_indices, preds, confidences):
+            results[i] = (pred, confidence)
+    
+    return results
+
+
+def _classify_cached(task: str, model, tokenizer, texts: List[str], max_length: int) -> List[tuple]:
+    """
+    _classify_batch with memoization.
+    
+    Texts already in the prediction cache, and repeats within texts, skip
+    tokenization and the forward pass.
+    
+    Args:
+        task: Prediction task, part of the cache key
+        model, tokenizer, texts, max_length: As for _classify_batch
+        
+    Returns:
+        Same as _classify_batch, in input order
+    """
+    cache = get_prediction_cache()
+    if cache is None:
+        return _classify_batch(model, tokenizer, texts, max_length)
+    
+    model_version = get_model_version()
+    texts = [normalize_text(text) for text in texts]
+    keys = [prediction_key(task, model_version, text) for text in texts]
+    
+    found = cache.get_many(keys)
+    # First index of each text still to classify
+    pending = {}
+    for i, key in enumerate(keys):
+        if key not in found:
+            pending.setdefault(key, i)
+    
+    if pending:
+        indices = list(pending.values())
+        predictions = _classify_batch(model, tokenizer, [texts[i] for i in indices], max_length)
+        computed = {keys[i]: prediction for i, prediction in zip(indices, predictions)}
+        cache.put_many(computed)
+        found.update(computed)
+    
+    return [found[key] for key in keys]
+
+
+def predict_section_headings(blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Predict which text blocks are section headings, in batches.
+    
+    Args:
+        blocks: Dictionaries with text, font_size and is_bold
+        
+    Returns:
+        One prediction dictionary per block, in input order
     """
+    fallback = {"is_heading": False, "confidence": 0.5, "method": "pattern"}
+    if not blocks:
+        return []
+    
     model, tokenizer = load_section_detector()
     
     if model is None or tokenizer is None:
         # Fallback to pattern-based
-        return {"is_heading": False, "confidence": 0.5, "method": "pattern"}
+        return [dict(fallback) for _ in blocks]
     
     try:
         # Prepare input
-        features_text = f"Font size: {font_size}. Bold: {1 if is_bold else 0}. {text}"
-        
-        inputs = tokenizer(
-            features_text,
-            truncation=True,
-            padding="max_length",
-            max_length=128,
-            return_tensors="pt"
-        )
+        texts = [
+            f"Font size: {block.get('font_size', 0)}. Bold: {1 if block.get('is_bold') else 0}. {block.get('text', '')}"
+            for block in blocks
+        ]
         
-        # Predict
-        with torch.no_grad():
-            outputs = model(**inputs)
-            probs = torch.softmax(outputs.logits, dim=1)
-            pred = torch.argmax(probs, dim=1).item()
-            confidence = probs[0][pred].item()
-        
-        return {
-            "is_heading": bool(pred == 1),
-            "confidence": float(confidence),
-            "method": "ml"
-        }
+        return [
+            {"is_heading": bool(pred == 1), "confidence": float(confidence), "method": "ml"}
+            for pred, confidence in _classify_cached("section_detection", model, tokenizer, texts, max_length=128)
+        ]
     except Exception as e:
         print(f"Error in section heading prediction: {e}")
-        return {"is_heading": False, "confidence": 0.5, "method": "pattern"}
+        return [dict(fallback) for _ in blocks]
 
 
-def predict_text_type(text: str, context_before: str = "", context_after: str = "") -> Dict[str, Any]:
+def predict_text_types(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Predict text type: rule, example, explanation, or other.
+    Predict text types (rule, example, explanation, other), in batches.
     
     Args:
-        text: Text to classify
-        context_before: Previous text for context
-        context_after: Next text for context
+        items: Dictionaries with text and optional context_before / context_after
         
     Returns:
-        Dictionary with prediction and confidence
+        One prediction dictionary per item, in input order
     """
+    fallback = {"text_type": "other", "confidence": 0.5, "method": "pattern"}
+    if not items:
+        return []
+    
     model, tokenizer = load_rule_classifier()
     
     if model is None or tokenizer is None:
         # Fallback to pattern-based
-        return {"text_type": "other", "confidence": 0.5, "method": "pattern"}
+        return [dict(fallback) for _ in items]
     
     try:
         # Prepare input with context
-        full_text = f"{context_before} {text} {context_after}".strip()
-        
-        inputs = tokenizer(
-            full_text,
-            truncation=True,
-            padding="max_length",
-            max_length=256,
-            return_tensors="pt"
-        )
+        texts = [
+            f"{item.get('context_before', '')} {item.get('text', '')} {item.get('context_after', '')}".strip()
+            for item in items
+        ]
         
-        # Predict
-        with torch.no_grad():
-            outputs = model(**inputs)
-            probs = torch.softmax(outputs.logits, dim=1)
-            pred = torch.argmax(probs, dim=1).item()
-            confidence = probs[0][pred].item()
-        
-        # Map to label
-        label_map = {0: "rule", 1: "example", 2: "explanation", 3: "other"}
-        text_type = label_map.get(pred, "other")
-        
-        return {
-            "text_type": text_type,
-            "confidence": float(confidence),
-            "method": "ml"
-        }
+        return [
+            {"text_type": TEXT_TYPE_LABELS.get(pred, "other"), "confidence": float(confidence), "method": "ml"}
+            for pred, confidence in _classify_cached("rule_classification", model, tokenizer, texts, max_length=256)
+        ]
     except Exception as e:
         print(f"Error in text type prediction: {e}")
-        return {"text_type": "other", "confidence": 0.5, "method": "pattern"}
+        return [dict(fallback) for _ in items]
 
 
-def predict_section_type(heading: str, content: str = "") -> Dict[str, Any]:
+def predict_section_types(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Predict section type: setup, gameplay, scoring, etc.
+    Predict section types (setup, gameplay, scoring, etc.), in batches.
     
     Args:
-        heading: Section heading text
-        content: Section content (optional)
+        items: Dictionaries with heading and optional content
         
     Returns:
-        Dictionary with prediction and confidence
+        One prediction dictionary per item, in input order
     """
+    fallback = {"section_type": "other", "confidence": 0.5, "method": "pattern"}
+    if not items:
+        return []
+    
     model, tokenizer = load_section_classifier()
     
     if model is None or tokenizer is None:
         # Fallback to pattern-based
-        return {"section_type": "other", "confidence": 0.5, "method": "pattern"}
+        return [dict(fallback) for _ in items]
     
     try:
         # Prepare input
-        full_text = f"{heading} {content}".strip()
-        
-        inputs = tokenizer(
-            full_text,
-            truncation=True,
-            padding="max_length",
-            max_length=256,
-            return_tensors="pt"
-        )
+        texts = [f"{item.get('heading', '')} {item.get('content', '')}".strip() for item in items]
         
-        # Predict
-        with torch.no_grad():
-            outputs = model(**inputs)
-            probs = torch.softmax(outputs.logits, dim=1)
-            pred = torch.argmax(probs, dim=1).item()
-            confidence = probs[0][pred].item()
-        
-        # Map to label
-        label_map = {
-            0: "setup", 1: "gameplay", 2: "objective", 3: "scoring",
-            4: "end_game", 5: "advanced", 6: "examples", 7: "faq", 8: "other"
-        }
-        section_type = label_map.get(pred, "other")
-        
-        return {
-            "section_type": section_type,
-            "confidence": float(confidence),
-            "method": "ml"
-        }
+        return [
+            {"section_type": SECTION_TYPE_LABELS.get(pred, "other"), "confidence": float(confidence), "method": "ml"}
+            for pred, confidence in _classify_cached("section_type", model, tokenizer, texts, max_length=256)
+        ]
     except Exception as e:
         print(f"Error in section type prediction: {e}")
-        return {"section_type": "other", "confidence": 0.5, "method": "pattern"}
+        return [dict(fallback) for _ in items]
 
+
+def warm_up() -> Dict[str, bool]:
+    """
+    Load the configured models and run one inference through each, so the
+    first request doesn't pay for loading or the runtime's first-call setup.
+    
+    Returns:
+        Whether each model is loaded
+    """
+    loaded = {}
+    samples = {
+        "section_detector": (load_section_detector, "Font size: 14. Bold: 1. Setup", 128),
+        "rule_classifier": (load_rule_classifier, "Each player draws two cards.", 256),
+        "section_classifier": (load_section_classifier, "Setup Place the board in the center of the table.", 256),
+    }
+    
+    for name, (loader, text, max_length) in samples.items():
+        model, tokenizer = loader()
+        loaded[name] = model is not None
+        if model is None:
+            continue
+        
+        try:
+            # Bypass the prediction cache so the forward pass really runs
+            _classify_batch(model, tokenizer, [text], max_length)
+        except Exception as e:
+            print(f"Error warming up {name}: {e}")
+    
+    return loaded
+
+
+def predict_section_heading(text: str, font_size: float = 0, is_bold: bool = False) -> Dict[str, Any]:
+    """
+    Predict if text is a section heading.
+    
+    Args:
+        text: Text to classify
+        font_size: Font size (for feature)
+        is_bold: Whether text is bold
+        
+    Returns:
+        Dictionary with prediction and confidence
+    """
+    return predict_section_headings([{"text": text, "font_size": font_size, "is_bold": is_bold}])[0]
+
+
+def predict_text_type(text: str, context_before: str = "", context_after: str = "") -> Dict[str, Any]:
+    """
+    Predict text type: rule, example, explanation, or other.
+    
+    Args:
+        text: Text to classify
+        context_before: Previous text for context
+        context_after: Next text for context
+        
+    Returns:
+        Dictionary with prediction and confidence
+    """
+    return predict_text_types([{"text": text, "context_before": context_before, "context_after": context_after}])[0]
+
+
+def predict_section_type(heading: str, content: str = "") -> Dict[str, Any]:
+    """
+    Predict section type: setup, gameplay, scoring, etc.
+    
+    Args:
+        heading: Section heading text
+        content: Section content (optional)
+        
+    Returns:
+        Dictionary with prediction and confidence
+    """
+    return predict_section_types([{"heading": heading, "content": content}])[0]
@@ -0,0 +1,105 @@
+"""
+Multi-task classifier: one shared encoder with a head per task.
+Used by Training/scripts/train_models.py to train jointly and by ml_models to
+serve section detection, rule classification and section type predictions
+from a single model.
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, Optional
+
+import torch
+from torch import nn
+from transformers import AutoModel
+
+# Task name -> number of labels; the order defines task ids
+TASK_LABELS = {
+    "section_detection": 2,      # heading or not
+    "rule_classification": 4,    # rule, example, explanation, other
+    "section_type": 9,           # setup, gameplay, objective, scoring, end_game, advanced, examples, faq, other
+}
+TASK_IDS = {task: i for i, task in enumerate(TASK_LABELS)}
+MAX_LABELS = max(TASK_LABELS.values())
+
+HEADS_FILE = "heads.bin"
+CONFIG_FILE = "multitask.json"
+
+
+class MultiTaskClassifier(nn.Module):
+    """Transformer encoder shared by one classification head per task."""
+
+    def __init__(self, encoder, tasks: Dict[str, int] = None, dropout: float = 0.1):
+        super().__init__()
+        self.encoder = encoder
+        self.tasks = dict(tasks or TASK_LABELS)
+        hidden_size = encoder.config.hidden_size
+
+        # Same shape as DistilBERT's sequence classification head
+        self.heads = nn.ModuleDict({
+            task: nn.Sequential(
+                nn.Linear(hidden_size, hidden_size),
+                nn.ReLU(),
+                nn.Dropout(dropout),
+                nn.Linear(hidden_size, num_labels),
+            )
+            for task, num_labels in self.tasks.items()
+        })
+
+    @classmethod
+    def from_base(cls, base_model: str) -> "MultiTaskClassifier":
+        """Create an untrained model on top of a pretrained encoder."""
+        return cls(AutoModel.from_pretrained(base_model))
+
+    @classmethod
+    def load(cls, model_dir: Path) -> "MultiTaskClassifier":
+        """Load a model saved with save()."""
+        with open(model_dir / CONFIG_FILE, "r") as f:
+            config = json.load(f)
+
+        model = cls(AutoModel.from_pretrained(model_dir), config["tasks"])
+        model.heads.load_state_dict(torch.load(model_dir / HEADS_FILE, map_location="cpu"))
+        return model
+
+    def save(self, model_dir: Path):
+        """Save encoder, heads and task configuration to model_dir."""
+        model_dir.mkdir(parents=True, exist_ok=True)
+        self.encoder.save_pretrained(model_dir)
+        torch.save(self.heads.state_dict(), model_dir / HEADS_FILE)
+        with open(model_dir / CONFIG_FILE, "w") as f:
+            json.dump({"tasks": self.tasks}, f, indent=2)
+
+    def encode(self, input_ids, attention_mask):
+        """Pooled ([CLS]) representation of each input."""
+        outputs = self.encoder(input_ids=input_ids, attention_mask=attention_mask)
+        return outputs.last_hidden_state[:, 0]
+
+    def task_logits(self, task: str, input_ids, attention_mask):
+        """Logits for one task."""
+        return self.heads[task](self.encode(input_ids, attention_mask))
+
+    def forward(self, input_ids, attention_mask, task_ids, labels: Optional[torch.Tensor] = None):
+        """
+        Training forward pass over a batch mixing examples from all tasks.
+
+        Each example goes through its own task's head. Logits are padded to
+        MAX_LABELS with a large negative value so batches stack, and the loss
+        is the sum of per-task cross entropies.
+        """
+        pooled = self.encode(input_ids, attention_mask)
+        logits = pooled.new_full((pooled.size(0), MAX_LABELS), -1e4)
+        loss = pooled.new_zeros(())
+
+        for task, head in self.heads.items():
+            rows = task_ids == TASK_IDS[task]
+            if not rows.any():
+                continue
+
+            task_logits = head(pooled[rows])
+            logits[rows, :task_logits.size(1)] = task_logits
+            if labels is not None:
+                loss = loss + nn.functional.cross_entropy(task_logits, labels[rows])
+
+        if labels is None:
+            return {"logits": logits}
+        return {"loss": loss, "logits": logits}
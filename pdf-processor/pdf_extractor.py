@@ -1,79 +1,402 @@
-import pdfplumber
-import fitz  # PyMuPDF
 import requests
-from io import BytesIO
-from typing import Dict, List, Any
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Callable, Iterable, Iterator, Optional
 
+# fitz (PyMuPDF) and pdfplumber are imported in the functions that use them,
+# so importing this module doesn't slow down service startup
 
-def extract_pdf_structure(pdf_url: str) -> Dict[str, Any]:
+# Refuse PDFs larger than this (bytes)
+MAX_PDF_BYTES = int(os.getenv("MAX_PDF_BYTES", 200 * 1024 * 1024))
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Where downloads are spooled (defaults to the system temp directory)
+PDF_SPOOL_DIR = os.getenv("PDF_SPOOL_DIR") or None
+# "pymupdf" (single fast pass) or "pdfplumber" (per-glyph parsing, slower)
+EXTRACTION_BACKEND = os.getenv("EXTRACTION_BACKEND", "pymupdf")
+# Processes used to extract page ranges of one document in parallel (1 = off)
+PAGE_WORKERS = int(os.getenv("PAGE_WORKERS", 1))
+# Documents with fewer pages are extracted serially
+PAGE_SHARD_MIN_PAGES = int(os.getenv("PAGE_SHARD_MIN_PAGES", 8))
+
+# Text larger than body size by this factor counts as a heading
+HEADING_SIZE_RATIO = 1.2
+# Common heading patterns: ALL CAPS, numbered headings, Title Case
+HEADING_PATTERN = re.compile(r"[A-Z][A-Z\s]+$|\d+\.\s+[A-Z]|[A-Z][a-z]+\s+[A-Z]")
+
+# Page-sharding pool (created lazily)
+_page_executor = None
+
+
+class DownloadedPDF:
+    """
+    A PDF spooled to a file on disk.
+    
+    Both parsers open the file by path, so the document is never held in
+    Python memory. Temporary files are deleted on close().
+    """
+    
+    def __init__(self, path: str, size: int, sha256: str, temporary: bool):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.temporary = temporary
+    
+    def close(self):
+        if self.temporary and os.path.exists(self.path):
+            os.remove(self.path)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_local_pdf(path: str) -> DownloadedPDF:
+    """
+    Wrap a PDF that is already on disk (used by the training scripts).
+    
+    Args:
+        path: Local path to the PDF file
+        
+    Returns:
+        DownloadedPDF pointing at the file (not deleted on close)
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return DownloadedPDF(str(path), os.path.getsize(path), digest.hexdigest(), temporary=False)
+
+
+def download_pdf(pdf_url: str) -> DownloadedPDF:
     """
-    Extract text and structure from PDF using pdfplumber and PyMuPDF.
+    Stream a PDF to a temporary file, hashing it on the way.
     
     Args:
         pdf_url: URL to the PDF file
         
     Returns:
-        Dictionary with extracted text, structure, and metadata
+        DownloadedPDF pointing at the temporary file
     """
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=PDF_SPOOL_DIR)
     try:
-        # Download PDF
-        response = requests.get(pdf_url, timeout=60)
-        response.raise_for_status()
-        pdf_bytes = BytesIO(response.content)
+        with os.fdopen(fd, "wb") as f, requests.get(pdf_url, timeout=60, stream=True) as response:
+            response.raise_for_status()
+            
+            content_length = int(response.headers.get("Content-Length") or 0)
+            if content_length > MAX_PDF_BYTES:
+                raise Exception(f"PDF is {content_length} bytes, limit is {MAX_PDF_BYTES}")
+            
+            digest = hashlib.sha256()
+            size = 0
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_PDF_BYTES:
+                    raise Exception(f"PDF exceeds the {MAX_PDF_BYTES} byte limit")
+                digest.update(chunk)
+                f.write(chunk)
+        
+        return DownloadedPDF(path, size, digest.hexdigest(), temporary=True)
+    except Exception as e:
+        os.remove(path)
+        raise Exception(f"PDF download failed: {str(e)}")
+
+
+class TextRun:
+    """
+    A run of consecutive text sharing one font size and weight.
+    
+    Replaces per-glyph dictionaries in pages_data: a page holds a handful of
+    runs instead of thousands of 20-key char dicts.
+    """
+    __slots__ = ("text", "font_size", "is_bold", "page", "x0", "top", "x1", "bottom")
+    
+    def __init__(self, text: str, font_size: float, is_bold: bool, page: int,
+                 x0: float, top: float, x1: float, bottom: float):
+        self.text = text
+        self.font_size = font_size
+        self.is_bold = is_bold
+        self.page = page
+        self.x0 = x0
+        self.top = top
+        self.x1 = x1
+        self.bottom = bottom
+    
+    def __repr__(self):
+        return f"TextRun({self.text!r}, size={self.font_size}, bold={self.is_bold}, page={self.page})"
+
+
+def build_text_runs(glyphs: Iterable[tuple], page: int) -> List[TextRun]:
+    """
+    Group glyphs (or spans) into runs, splitting on font size, weight or newline.
+    
+    Args:
+        glyphs: (text, font_size, is_bold, x0, top, x1, bottom) tuples in reading order
+        page: Page number the glyphs belong to
         
-        # Extract with pdfplumber for text and structure
+    Returns:
+        Runs with non-blank text
+    """
+    runs = []
+    parts = []
+    run_size = None
+    run_bold = False
+    x0 = top = x1 = bottom = 0
+    
+    def flush():
+        text = "".join(parts)
+        if text.strip():
+            runs.append(TextRun(text, run_size, run_bold, page, x0, top, x1, bottom))
+    
+    for text, size, bold, g_x0, g_top, g_x1, g_bottom in glyphs:
+        if run_size is None or size != run_size or bold != run_bold or text == "\n":
+            if run_size is not None:
+                flush()
+            parts = [] if text == "\n" else [text]
+            run_size, run_bold = size, bold
+            x0, top, x1, bottom = g_x0, g_top, g_x1, g_bottom
+        else:
+            parts.append(text)
+            x0, top = min(x0, g_x0), min(top, g_top)
+            x1, bottom = max(x1, g_x1), max(bottom, g_bottom)
+    
+    if run_size is not None:
+        flush()
+    
+    return runs
+
+
+def iter_pages_pymupdf(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Extract pages with PyMuPDF in a single pass over the document.
+    
+    Font information comes from text spans (one entry per run of glyphs
+    sharing a font), which is much cheaper than per-glyph parsing.
+    
+    Args:
+        path: Path to the PDF file
+        start: First page index to extract (0-based)
+        end: Page index to stop before (default: end of document)
+        
+    Yields:
+        Page dictionaries with page, total_pages, text, tables, runs and has_images
+    """
+    import fitz  # PyMuPDF
+    
+    with fitz.open(path, filetype="pdf") as doc:
+        total_pages = len(doc)
+        
+        for page_index in range(start, total_pages if end is None else min(end, total_pages)):
+            page = doc[page_index]
+            page_num = page_index + 1
+            page_text = page.get_text()
+            
+            tables = []
+            if hasattr(page, "find_tables"):  # PyMuPDF >= 1.23
+                tables = [table.extract() for table in page.find_tables().tables]
+            
+            spans = (
+                (span["text"], span["size"], bool(span["flags"] & 16) or "Bold" in span["font"], *span["bbox"])
+                for block in page.get_text("dict")["blocks"]
+                if block.get("type") == 0  # Text blocks only
+                for line in block["lines"]
+                for span in line["spans"]
+            )
+            
+            yield {
+                "page": page_num,
+                "total_pages": total_pages,
+                "text": page_text,
+                "tables": tables,
+                "runs": build_text_runs(spans, page_num),
+                "has_images": bool(page.get_images()),
+            }
+
+
+def iter_pages_pdfplumber(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Extract pages with pdfplumber (per-glyph font data) and check images with PyMuPDF.
+    
+    Args:
+        path: Path to the PDF file
+        start: First page index to extract (0-based)
+        end: Page index to stop before (default: end of document)
+        
+    Yields:
+        Page dictionaries with page, total_pages, text, tables, runs and has_images
+    """
+    import fitz  # PyMuPDF
+    import pdfplumber
+    
+    with pdfplumber.open(path) as pdf, fitz.open(path, filetype="pdf") as doc:
+        total_pages = len(pdf.pages)
+        
+        for page_num, page in enumerate(pdf.pages[start:end], start + 1):
+            glyphs = (
+                (c.get("text", ""), c.get("size", 0), "Bold" in c.get("fontname", ""),
+                 c.get("x0", 0), c.get("top", 0), c.get("x1", 0), c.get("bottom", 0))
+                for c in page.chars
+            )
+            
+            yield {
+                "page": page_num,
+                "total_pages": total_pages,
+                "text": page.extract_text() or "",
+                "tables": page.extract_tables(),
+                "runs": build_text_runs(glyphs, page_num),
+                "has_images": bool(doc[page_num - 1].get_images()),
+            }
+            
+            # Drop pdfplumber's parsed glyphs for this page
+            page.flush_cache()
+
+
+EXTRACTION_BACKENDS = {
+    "pymupdf": iter_pages_pymupdf,
+    "pdfplumber": iter_pages_pdfplumber,
+}
+
+
+def _extract_page_range(backend: str, path: str, start: int, end: int) -> List[Dict[str, Any]]:
+    """Extract one shard of pages (runs in a page worker process)."""
+    return list(EXTRACTION_BACKENDS[backend](path, start, end))
+
+
+def get_page_executor() -> ProcessPoolExecutor:
+    """Get the page-sharding pool, creating it on first use."""
+    global _page_executor
+    
+    if _page_executor is None:
+        _page_executor = ProcessPoolExecutor(
+            max_workers=PAGE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    
+    return _page_executor
+
+
+def iter_pages(path: str, backend: str) -> Iterator[Dict[str, Any]]:
+    """
+    Extract pages in page order, sharding the document across PAGE_WORKERS
+    processes when it is large enough.
+    
+    Args:
+        path: Path to the PDF file
+        backend: Name of the extraction backend
+        
+    Yields:
+        Page dictionaries from the backend, in page order
+    """
+    if backend not in EXTRACTION_BACKENDS:
+        raise ValueError(f"Unknown extraction backend: {backend}")
+    
+    import fitz  # PyMuPDF
+    
+    with fitz.open(path, filetype="pdf") as doc:
+        total_pages = len(doc)
+    
+    if PAGE_WORKERS <= 1 or total_pages < PAGE_SHARD_MIN_PAGES:
+        yield from EXTRACTION_BACKENDS[backend](path)
+        return
+    
+    # Twice as many shards as workers evens out pages of uneven cost
+    shard_size = max(1, -(-total_pages // (PAGE_WORKERS * 2)))
+    executor = get_page_executor()
+    futures = [
+        executor.submit(_extract_page_range, backend, path, start, min(start + shard_size, total_pages))
+        for start in range(0, total_pages, shard_size)
+    ]
+    
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def extract_pdf_structure(pdf_url: str, progress_callback: Optional[Callable[[int, int], None]] = None, pdf_file: Optional[DownloadedPDF] = None, analyze: bool = True) -> Dict[str, Any]:
+    """
+    Extract text and structure from PDF using the configured extraction backend.
+    
+    Args:
+        pdf_url: URL to the PDF file
+        progress_callback: Optional function called with (page, total_pages) after each page
+        pdf_file: Already downloaded PDF (skips the download; the caller closes it)
+        analyze: Run analyze_structure; if False, "structure" is None and the
+            caller analyzes pages_data later (e.g. to batch inference across documents)
+        
+    Returns:
+        Dictionary with extracted text, structure, and metadata
+    """
+    if pdf_file is None:
+        with download_pdf(pdf_url) as downloaded:
+            return extract_pdf_structure(pdf_url, progress_callback, downloaded, analyze)
+    
+    try:
         pages_data = []
-        total_text = ""
+        # Document text is joined once at the end; page_offsets records where
+        # each page's segment starts and ends in it
+        text_parts = []
+        text_length = 0
+        page_offsets = []
+        total_pages = 0
         has_tables = False
         has_images = False
         
-        with pdfplumber.open(pdf_bytes) as pdf:
-            total_pages = len(pdf.pages)
+        for page_result in iter_pages(pdf_file.path, EXTRACTION_BACKEND):
+            page_num = page_result["page"]
+            total_pages = page_result["total_pages"]
+            page_text = page_result["text"]
+            page_start = text_length
+            
+            marker = f"\n\n--- Page {page_num} ---\n\n"
+            text_parts.append(marker)
+            text_parts.append(page_text)
+            text_offset = page_start + len(marker)
+            text_length = text_offset + len(page_text)
+            
+            # Check for tables
+            tables = page_result["tables"]
+            if tables:
+                has_tables = True
+                for table in tables:
+                    # Convert table to markdown-like format
+                    table_text = "\n".join([" | ".join(str(cell) if cell else "" for cell in row) for row in table])
+                    segment = f"\n\n[Table]\n{table_text}\n"
+                    text_parts.append(segment)
+                    text_length += len(segment)
             
-            for page_num, page in enumerate(pdf.pages, 1):
-                page_text = page.extract_text() or ""
-                total_text += f"\n\n--- Page {page_num} ---\n\n{page_text}"
-                
-                # Check for tables
-                tables = page.extract_tables()
-                if tables:
-                    has_tables = True
-                    for table in tables:
-                        # Convert table to markdown-like format
-                        table_text = "\n".join([" | ".join(str(cell) if cell else "" for cell in row) for row in table])
-                        total_text += f"\n\n[Table]\n{table_text}\n"
-                
-                # Extract text with formatting info
-                chars = page.chars
-                if chars:
-                    pages_data.append({
-                        "page": page_num,
-                        "text": page_text,
-                        "chars": chars,  # For font size detection
-                    })
-        
-        # Use PyMuPDF for additional structure detection
-        pdf_bytes.seek(0)
-        doc = fitz.open(stream=pdf_bytes.read(), filetype="pdf")
-        
-        # Check for images
-        for page in doc:
-            image_list = page.get_images()
-            if image_list:
+            page_offsets.append({"page": page_num, "start": page_start, "end": text_length})
+            
+            if page_result["has_images"]:
                 has_images = True
-                break
+            
+            # Extract text with formatting info
+            runs = page_result["runs"]
+            if runs:
+                pages_data.append({
+                    "page": page_num,
+                    "text": page_text,
+                    "text_offset": text_offset,  # Where page text starts in full_text
+                    "runs": runs,  # For font size detection
+                })
+            
+            if progress_callback:
+                progress_callback(page_num, total_pages)
         
         # Extract headings and structure using font analysis (try ML if available)
-        try:
-            from ml_models import predict_section_heading
-            use_ml = True
-        except ImportError:
-            use_ml = False
-        
-        structure = analyze_structure(pages_data, use_ml=use_ml)
+        structure = analyze_structure(pages_data, use_ml=ml_available()) if analyze else None
         
         return {
-            "full_text": total_text,
+            "full_text": "".join(text_parts),
+            "page_offsets": page_offsets,
             "pages_data": pages_data,
             "total_pages": total_pages,
             "has_tables": has_tables,
@@ -85,12 +408,89 @@ def extract_pdf_structure(pdf_url: str) -> Dict[str, Any]:
         raise Exception(f"PDF extraction failed: {str(e)}")
 
 
-def analyze_structure(pages_data: List[Dict], use_ml: bool = False) -> Dict[str, Any]:
+def compute_font_stats(blocks: List[TextRun]) -> Dict[str, Any]:
+    """
+    Compute document-level font size statistics in one pass.
+    
+    Sizes are weighted by character count, so the body size is the size most
+    of the document's text is set in, unaffected by a few large titles.
+    
+    Args:
+        blocks: Text runs of the whole document
+        
+    Returns:
+        Dictionary with body_size (weighted mode), p50, p90 and max font sizes
+        (None when the document has no sized text)
+    """
+    char_counts = Counter()
+    for block in blocks:
+        if block.font_size:
+            char_counts[block.font_size] += len(block.text)
+    
+    if not char_counts:
+        return {"body_size": None, "p50": None, "p90": None, "max": None}
+    
+    body_size = char_counts.most_common(1)[0][0]
+    
+    # Percentiles from the cumulative distribution over distinct sizes
+    total = sum(char_counts.values())
+    percentiles = {}
+    cumulative = 0
+    targets = [("p50", 0.5), ("p90", 0.9)]
+    for size in sorted(char_counts):
+        cumulative += char_counts[size]
+        while targets and cumulative >= total * targets[0][1]:
+            percentiles[targets.pop(0)[0]] = size
+    
+    return {
+        "body_size": body_size,
+        "p50": percentiles["p50"],
+        "p90": percentiles["p90"],
+        "max": max(char_counts),
+    }
+
+
+def ml_available() -> bool:
+    """Whether the ML stack is installed (without importing it)."""
+    try:
+        from ml_models import ml_stack_available
+    except ImportError:
+        return False
+    return ml_stack_available()
+
+
+def _heading_query(block: TextRun, text: str) -> Dict[str, Any]:
+    """Input for the section heading model."""
+    return {"text": text, "font_size": block.font_size or 0, "is_bold": block.is_bold}
+
+
+def heading_queries(pages_data: List[Dict]) -> List[Dict[str, Any]]:
+    """
+    Inputs analyze_structure passes to the section heading model.
+    
+    Args:
+        pages_data: List of page data with text runs
+        
+    Returns:
+        One model input per text block, in document order
+    """
+    return [
+        _heading_query(run, run.text.strip())
+        for page_data in pages_data
+        for run in page_data.get("runs", [])
+        if run.text.strip()
+    ]
+
+
+def analyze_structure(pages_data: List[Dict], use_ml: bool = False, heading_predictions: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
     """
     Analyze PDF structure to detect headings, sections, and hierarchy.
     
     Args:
-        pages_data: List of page data with text and character information
+        pages_data: List of page data with text and text runs
+        use_ml: Use the section heading model
+        heading_predictions: Heading predictions already made for
+            heading_queries(pages_data) (skips the model call)
         
     Returns:
         Dictionary with detected structure
@@ -100,120 +500,97 @@ def analyze_structure(pages_data: List[Dict], use_ml: bool = False) -> Dict[str,
         "sections": [],
     }
     
-    # Collect all text blocks with font information
-    all_blocks = []
-    for page_data in pages_data:
-        chars = page_data.get("chars", [])
-        if not chars:
-            continue
-        
-        # Group characters by font size and style
-        current_block = {
-            "text": "",
-            "font_size": None,
-            "is_bold": False,
-            "page": page_data["page"],
-            "y0": None,
-        }
+    # Collect all text blocks with font information (runs built during extraction)
+    all_blocks = [run for page_data in pages_data for run in page_data.get("runs", [])]
+    
+    # Document-level font statistics, computed once
+    font_stats = compute_font_stats(all_blocks)
+    structure["font_stats"] = font_stats
+    heading_min_size = font_stats["body_size"] * HEADING_SIZE_RATIO if font_stats["body_size"] else None
+    
+    # Blocks with text, in document order
+    candidates = [(i, block, block.text.strip()) for i, block in enumerate(all_blocks) if block.text.strip()]
+    
+    # Use ML model if available for better detection (one batched call per document)
+    ml_results = heading_predictions
+    if ml_results is None and use_ml:
+        try:
+            from ml_models import predict_section_headings
+            ml_results = predict_section_headings([_heading_query(block, text) for _, block, text in candidates])
+        except ImportError:
+            pass  # ML models not available, use pattern-based
+        except Exception as e:
+            print(f"ML prediction error: {e}")
+    
+    # Headings are located in their page's text with a forward-only cursor,
+    # so each lookup only scans from the previous heading on that page
+    pages_by_number = {page_data["page"]: page_data for page_data in pages_data}
+    page_cursors = {}
+    lowered_pages = {}
+    
+    def locate(page: int, heading_text: str) -> Optional[int]:
+        """Offset of heading_text in full_text, or None if not found."""
+        page_data = pages_by_number.get(page)
+        if page_data is None or "text_offset" not in page_data:
+            return None
         
-        for char in chars:
-            char_font_size = char.get("size", 0)
-            char_text = char.get("text", "")
-            char_bold = "Bold" in char.get("fontname", "")
-            char_y0 = char.get("top", 0)
-            
-            # Detect block boundaries (font size changes or new lines)
-            if current_block["font_size"] is None:
-                current_block["font_size"] = char_font_size
-                current_block["is_bold"] = char_bold
-                current_block["y0"] = char_y0
-            
-            if (char_font_size != current_block["font_size"] or 
-                char_bold != current_block["is_bold"] or
-                char_text == "\n"):
-                # Save current block if it has content
-                if current_block["text"].strip():
-                    all_blocks.append(current_block)
-                
-                # Start new block
-                current_block = {
-                    "text": char_text if char_text != "\n" else "",
-                    "font_size": char_font_size,
-                    "is_bold": char_bold,
-                    "page": page_data["page"],
-                    "y0": char_y0,
-                }
-            else:
-                current_block["text"] += char_text
-        
-        # Add last block
-        if current_block["text"].strip():
-            all_blocks.append(current_block)
+        page_text = page_data["text"]
+        cursor = page_cursors.get(page, 0)
+        pos = page_text.find(heading_text, cursor)
+        if pos == -1:
+            # Case-insensitive fallback
+            if page not in lowered_pages:
+                lowered_pages[page] = page_text.lower()
+            lowered = lowered_pages[page]
+            if len(lowered) == len(page_text):
+                pos = lowered.find(heading_text.lower(), cursor)
+        if pos == -1:
+            return None
+        
+        page_cursors[page] = pos + len(heading_text)
+        return page_data["text_offset"] + pos
     
     # Identify headings (larger font, bold, or specific patterns)
     headings = []
-    for i, block in enumerate(all_blocks):
-        text = block["text"].strip()
-        if not text:
-            continue
-        
+    for n, (i, block, text) in enumerate(candidates):
         # Heading detection criteria
         is_heading = False
         
-        # Large font size (relative to other text)
-        font_sizes = [b["font_size"] for b in all_blocks if b["font_size"]]
-        if font_sizes:
-            avg_font_size = sum(font_sizes) / len(font_sizes)
-            if block["font_size"] and block["font_size"] > avg_font_size * 1.2:
-                is_heading = True
+        # Large font size (relative to body text)
+        if heading_min_size and block.font_size and block.font_size > heading_min_size:
+            is_heading = True
         
         # Bold text
-        if block["is_bold"] and len(text) < 100:
+        if block.is_bold and len(text) < 100:
             is_heading = True
         
         # Common heading patterns
-        heading_patterns = [
-            r"^[A-Z][A-Z\s]+$",  # ALL CAPS
-            r"^\d+\.\s+[A-Z]",  # Numbered headings
-            r"^[A-Z][a-z]+\s+[A-Z]",  # Title Case
-        ]
-        import re
-        for pattern in heading_patterns:
-            if re.match(pattern, text):
-                is_heading = True
-                break
-        
-        # Use ML model if available for better detection
-        if use_ml:
-            try:
-                from ml_models import predict_section_heading
-                ml_result = predict_section_heading(
-                    text,
-                    block.get("font_size", 0),
-                    block.get("is_bold", False)
-                )
-                # Use ML prediction if confident, otherwise use pattern-based
-                if ml_result.get("confidence", 0) > 0.7:
-                    is_heading = ml_result.get("is_heading", is_heading)
-            except ImportError:
-                pass  # ML models not available, use pattern-based
-            except Exception as e:
-                print(f"ML prediction error: {e}")
+        if HEADING_PATTERN.match(text):
+            is_heading = True
+        
+        # Use ML prediction if confident, otherwise use pattern-based
+        if ml_results:
+            ml_result = ml_results[n]
+            if ml_result.get("confidence", 0) > 0.7:
+                is_heading = ml_result.get("is_heading", is_heading)
         
         if is_heading:
             headings.append({
                 "text": text,
                 "level": determine_heading_level(block, headings),
-                "page": block["page"],
-                "position": i,
-                "font_size": block.get("font_size"),
+                "page": block.page,
+                "position": i,  # Index into structure["blocks"]
+                "offset": locate(block.page, text),  # In full_text
+                "font_size": block.font_size,
+                "is_bold": block.is_bold,
             })
     
     structure["headings"] = headings
+    structure["blocks"] = all_blocks
     return structure
 
 
-def determine_heading_level(block: Dict, existing_headings: List[Dict]) -> int:
+def determine_heading_level(block: TextRun, existing_headings: List[Dict]) -> int:
     """
     Determine heading level based on font size and position.
     
@@ -229,10 +606,10 @@ def determine_heading_level(block: Dict, existing_headings: List[Dict]) -> int:
     
     # Compare font size with previous headings
     last_heading = existing_headings[-1]
-    if block["font_size"] and last_heading.get("font_size"):
-        if block["font_size"] > last_heading["font_size"]:
+    if block.font_size and last_heading.get("font_size"):
+        if block.font_size > last_heading["font_size"]:
             return max(1, last_heading["level"] - 1)
-        elif block["font_size"] < last_heading["font_size"]:
+        elif block.font_size < last_heading["font_size"]:
             return last_heading["level"] + 1
     
     return last_heading.get("level", 1)
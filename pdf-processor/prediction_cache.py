@@ -0,0 +1,215 @@
+"""
+Memoization of ML predictions for repeated text.
+Rulebooks repeat running headers, footers and component names on every page,
+so predictions are cached per (task, model version, normalized input text) in
+an in-memory LRU, optionally backed by a SQLite file shared across workers
+and restarts.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, Optional
+
+PREDICTION_CACHE_ENABLED = os.getenv("PREDICTION_CACHE_ENABLED", "true").lower() == "true"
+# Predictions kept in memory per worker
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", 10000))
+# SQLite file for the persistent tier; unset keeps predictions in memory only
+PREDICTION_CACHE_PATH = os.getenv("PREDICTION_CACHE_PATH", "")
+# Persistent tier size limit; least recently used predictions are pruned beyond it
+PREDICTION_CACHE_DISK_ITEMS = int(os.getenv("PREDICTION_CACHE_DISK_ITEMS", 1000000))
+
+# Prune the persistent tier after this many writes
+PRUNE_INTERVAL = 1000
+# Seconds before a read refreshes a prediction's usedAt; pruning only needs
+# a rough order, and skipping the write keeps readers off the write lock
+USED_AT_REFRESH_SECONDS = 3600
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace, which doesn't change the tokenized input."""
+    return " ".join(text.split())
+
+
+def prediction_key(task: str, model_version: str, text: str) -> str:
+    """
+    Build the cache key for one prediction.
+    
+    Args:
+        task: Prediction task (e.g. "section_detection")
+        model_version: Version of the installed models
+        text: Normalized model input, including any features encoded in it
+    
+    Returns:
+        Hex SHA-256 digest
+    """
+    return hashlib.sha256(f"{task}\0{model_version}\0{text}".encode()).hexdigest()
+
+
+class PredictionCache:
+    """LRU cache of predictions with an optional SQLite tier."""
+    
+    def __init__(self, max_items: int, db_path: str = "", disk_items: int = 0):
+        self.max_items = max_items
+        self.disk_items = disk_items
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes = 0
+        
+        if db_path:
+            self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            with self._lock, self._conn:
+                # WAL lets worker processes read while another one writes
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS predictions (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        usedAt REAL
+                    )
+                    """
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS predictions_used ON predictions (usedAt)")
+    
+    def _remember(self, items: Dict[str, Any]):
+        for key, value in items.items():
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+    
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Look up predictions.
+        
+        Args:
+            keys: Keys from prediction_key()
+        
+        Returns:
+            Mapping of found keys to their predictions
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+            
+            missing = [key for key in keys if key not in found]
+            if missing and self._conn is not None:
+                try:
+                    from_disk = self._read(missing)
+                except sqlite3.Error as e:
+                    print(f"Prediction cache read error: {e}")
+                    from_disk = {}
+                self._remember(from_disk)
+                found.update(from_disk)
+            
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        
+        return found
+    
+    def _read(self, keys) -> Dict[str, Any]:
+        found = {}
+        stale = []
+        now = time.time()
+        stale_before = now - USED_AT_REFRESH_SECONDS
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT key, value, usedAt FROM predictions WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            for key, value, used_at in rows:
+                found[key] = json.loads(value)
+                if used_at is None or used_at < stale_before:
+                    stale.append(key)
+        
+        if stale:
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE predictions SET usedAt = ? WHERE key = ?",
+                    [(now, key) for key in stale],
+                )
+        return found
+    
+    def put_many(self, items: Dict[str, Any]):
+        """
+        Store predictions.
+        
+        Args:
+            items: Mapping of key to JSON-serializable prediction
+        """
+        if not items:
+            return
+        
+        with self._lock:
+            self._remember(items)
+            
+            if self._conn is None:
+                return
+            
+            now = time.time()
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO predictions (key, value, usedAt) VALUES (?, ?, ?)",
+                        [(key, json.dumps(value), now) for key, value in items.items()],
+                    )
+                
+                self._writes += len(items)
+                if self._writes >= PRUNE_INTERVAL:
+                    self._writes = 0
+                    self._prune()
+            except sqlite3.Error as e:
+                print(f"Prediction cache write error: {e}")
+    
+    def _prune(self):
+        """Delete least recently used predictions beyond disk_items."""
+        with self._conn:
+            self._conn.execute(
+                """
+                DELETE FROM predictions WHERE key IN (
+                    SELECT key FROM predictions ORDER BY usedAt DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.disk_items,),
+            )
+    
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size of the memory tier."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._memory),
+                "maxSize": self.max_items,
+            }
+
+
+_cache = None
+
+
+def get_prediction_cache() -> Optional[PredictionCache]:
+    """Get the process-wide prediction cache, or None if caching is disabled."""
+    global _cache
+    
+    if not PREDICTION_CACHE_ENABLED or PREDICTION_CACHE_SIZE <= 0:
+        return None
+    
+    if _cache is None:
+        _cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_PATH, PREDICTION_CACHE_DISK_ITEMS)
+    
+    return _cache
@@ -1,18 +1,45 @@
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterator, Optional
 import sys
 from pathlib import Path
 
-# Try to import ML models (may not be available if models not trained yet)
+from keyword_matcher import KeywordMatcher
+
+# Try to import ML models (may not be available if models not trained yet).
+# ml_models loads torch/transformers lazily, so check they are installed
 try:
     from ml_models import (
-        predict_section_heading, predict_text_type, predict_section_type
+        predict_section_heading, predict_text_type, predict_section_type,
+        predict_section_headings, predict_text_types, predict_section_types,
+        ml_stack_available
     )
-    ML_MODELS_AVAILABLE = True
+    ML_MODELS_AVAILABLE = ml_stack_available()
 except ImportError:
     ML_MODELS_AVAILABLE = False
+
+if not ML_MODELS_AVAILABLE:
     print("ML models not available, using pattern-based detection only")
 
+# Bump whenever extraction or parsing output changes, so cached results
+# from older versions are not served
+PARSER_VERSION = "5"
+
+# Common section titles in board games
+COMMON_SECTIONS = [
+    "Setup", "Set Up", "Setting Up",
+    "Gameplay", "How to Play", "Playing the Game",
+    "Components", "Contents", "What's in the Box",
+    "Objective", "Goal", "Winning",
+    "Scoring", "Points", "Victory Points",
+    "End of Game", "Game End", "Ending the Game",
+    "Rules", "Rules of Play", "Game Rules",
+    "Advanced Rules", "Optional Rules", "Variants",
+    "Examples", "Example", "Example Play",
+]
+
+# All section titles matched in a single pass over the text
+SECTION_MATCHER = KeywordMatcher({name: name for name in COMMON_SECTIONS})
+
 
 def parse_rules(pdf_structure: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
@@ -24,24 +51,39 @@ def parse_rules(pdf_structure: Dict[str, Any]) -> List[Dict[str, Any]]:
     Returns:
         List of sections with subsections, organized hierarchically
     """
+    return list(iter_rules(pdf_structure))
+
+
+def iter_rules(pdf_structure: Dict[str, Any], type_predictions: Optional[List[Dict[str, Any]]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Parse PDF structure into organized rule sections, yielding each section
+    as soon as it is complete (a section ends where the next one starts).
+    
+    Args:
+        pdf_structure: Dictionary from pdf_extractor with text and structure
+        type_predictions: Section type predictions already made for
+            section_type_queries(headings) (skips the model call)
+        
+    Yields:
+        Sections with subsections, in document order
+    """
     full_text = pdf_structure.get("full_text", "")
     structure = pdf_structure.get("structure", {})
     headings = structure.get("headings", [])
     
     # Split text into sections based on headings
-    sections = []
-    
     if not headings:
         # Fallback: try to detect sections by common patterns
         sections = detect_sections_by_patterns(full_text)
     else:
         # Use detected headings to create sections (with ML enhancement)
-        sections = create_sections_from_headings(full_text, headings, pdf_structure)
+        sections = iter_sections_from_headings(full_text, headings, pdf_structure, type_predictions)
     
     # Clean and organize sections
-    sections = organize_sections(sections)
-    
-    return sections
+    for section in sections:
+        organized = organize_section(section)
+        if organized is not None:
+            yield organized
 
 
 def detect_sections_by_patterns(text: str) -> List[Dict[str, Any]]:
@@ -56,44 +98,18 @@ def detect_sections_by_patterns(text: str) -> List[Dict[str, Any]]:
     """
     sections = []
     
-    # Common section titles in board games
-    common_sections = [
-        "Setup", "Set Up", "Setting Up",
-        "Gameplay", "How to Play", "Playing the Game",
-        "Components", "Contents", "What's in the Box",
-        "Objective", "Goal", "Winning",
-        "Scoring", "Points", "Victory Points",
-        "End of Game", "Game End", "Ending the Game",
-        "Rules", "Rules of Play", "Game Rules",
-        "Advanced Rules", "Optional Rules", "Variants",
-        "Examples", "Example", "Example Play",
+    # Find all section titles (case-insensitive, longest match wins)
+    section_patterns = [
+        {"title": title, "position": start, "end": end, "level": 1}
+        for start, end, title, _ in SECTION_MATCHER.finditer(text)
     ]
     
-    # Split text by common section markers
-    text_lower = text.lower()
-    section_patterns = []
-    
-    for section_name in common_sections:
-        # Find all occurrences (case-insensitive)
-        pattern = re.compile(re.escape(section_name), re.IGNORECASE)
-        for match in pattern.finditer(text):
-            section_patterns.append({
-                "title": section_name,
-                "position": match.start(),
-                "level": 1,
-            })
-    
-    # Sort by position
-    section_patterns.sort(key=lambda x: x["position"])
-    
     # Extract content between sections
     for i, pattern in enumerate(section_patterns):
-        start_pos = pattern["position"]
         end_pos = section_patterns[i + 1]["position"] if i + 1 < len(section_patterns) else len(text)
         
-        content = text[start_pos:end_pos].strip()
-        # Remove the section title from content
-        content = re.sub(re.escape(pattern["title"]), "", content, flags=re.IGNORECASE).strip()
+        # Content starts after the section title
+        content = text[pattern["end"]:end_pos].strip()
         
         sections.append({
             "id": slugify(pattern["title"]),
@@ -123,22 +139,46 @@ def create_sections_from_headings(text: str, headings: List[Dict[str, Any]], pdf
     Args:
         text: Full PDF text
         headings: List of detected headings with levels
-        pdf_structure: Full PDF structure (for ML model access to blocks)
+        pdf_structure: Full PDF structure (for page offsets)
         
     Returns:
         List of sections organized by heading hierarchy
     """
-    sections = []
+    return list(iter_sections_from_headings(text, headings, pdf_structure))
+
+
+def iter_sections_from_headings(text: str, headings: List[Dict[str, Any]], pdf_structure: Dict[str, Any] = None, type_predictions: Optional[List[Dict[str, Any]]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Create sections from detected headings, yielding each main section once
+    the next one starts.
+    
+    Args:
+        text: Full PDF text
+        headings: List of detected headings with levels
+        pdf_structure: Full PDF structure (for page offsets)
+        type_predictions: Section type predictions already made for
+            section_type_queries(headings) (skips the model call)
+        
+    Yields:
+        Sections (with subsections) in document order
+    """
+    # Sections yielded so far
+    finished = 0
     current_section = None
     
-    # Get blocks if available for ML predictions
-    blocks = pdf_structure.get("pages_data", []) if pdf_structure else []
-    all_blocks = []
-    for page_data in blocks:
-        all_blocks.extend(page_data.get("chars", []))
+    headings_sorted = sort_headings(headings)
     
-    # Sort headings by position
-    headings_sorted = sorted(headings, key=lambda h: (h["page"], h.get("position", 0)))
+    # Predict all section types in one batched call
+    type_results = type_predictions or []
+    if type_predictions is None and ML_MODELS_AVAILABLE:
+        try:
+            type_results = predict_section_types(section_type_queries(headings_sorted))
+        except Exception as e:
+            print(f"ML prediction error: {e}")
+    
+    # Where each heading starts in the text (non-decreasing)
+    page_offsets = pdf_structure.get("page_offsets", []) if pdf_structure else []
+    positions = locate_headings(text, headings_sorted, page_offsets)
     
     for i, heading in enumerate(headings_sorted):
         heading_text = heading["text"]
@@ -146,36 +186,20 @@ def create_sections_from_headings(text: str, headings: List[Dict[str, Any]], pdf
         
         # Use ML model to refine section type if available
         section_type = "other"
-        if ML_MODELS_AVAILABLE:
-            try:
-                # Get heading block for font info
-                heading_block = None
-                for block in all_blocks:
-                    if heading_text in block.get("text", ""):
-                        heading_block = block
-                        break
-                
-                # Predict section type
-                ml_result = predict_section_type(heading_text, "")
-                if ml_result.get("confidence", 0) > 0.6:  # Use ML if confident
-                    section_type = ml_result.get("section_type", "other")
-            except Exception as e:
-                print(f"ML prediction error: {e}")
-        
-        # Find content for this heading
-        start_pos = find_heading_position(text, heading_text)
-        next_heading = headings_sorted[i + 1] if i + 1 < len(headings_sorted) else None
-        end_pos = find_heading_position(text, next_heading["text"]) if next_heading else len(text)
+        ml_result = type_results[i] if type_results else {}
+        if ml_result.get("confidence", 0) > 0.6:  # Use ML if confident
+            section_type = ml_result.get("section_type", "other")
         
-        content = text[start_pos:end_pos].strip() if start_pos < end_pos else ""
-        # Remove heading from content
-        content = re.sub(re.escape(heading_text), "", content, flags=re.IGNORECASE).strip()
+        # Content runs from the end of this heading to the next one
+        start_pos, heading_length = positions[i]
+        end_pos = positions[i + 1][0] if i + 1 < len(positions) else len(text)
+        content = text[start_pos + heading_length:end_pos].strip()
         
         section_data = {
             "id": slugify(heading_text),
             "title": heading_text,
             "content": content,
-            "order": len(sections) + 1,
+            "order": finished + 1,
             "subsections": [],
             "section_type": section_type,
         }
@@ -183,7 +207,8 @@ def create_sections_from_headings(text: str, headings: List[Dict[str, Any]], pdf
         if heading_level == 1:
             # Main section
             if current_section:
-                sections.append(current_section)
+                yield current_section
+                finished += 1
             current_section = section_data
         else:
             # Subsection
@@ -196,41 +221,72 @@ def create_sections_from_headings(text: str, headings: List[Dict[str, Any]], pdf
                 })
             else:
                 # No parent section, treat as main section
-                sections.append(section_data)
+                yield section_data
+                finished += 1
     
     # Add last section
     if current_section:
-        sections.append(current_section)
-    
-    return sections
+        yield current_section
+
+
+def sort_headings(headings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Headings in document order (by page, then position)."""
+    return sorted(headings, key=lambda h: (h["page"], h.get("position", 0)))
+
+
+def section_type_queries(headings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Inputs create_sections_from_headings passes to the section type model, in document order."""
+    return [{"heading": h["text"], "content": ""} for h in sort_headings(headings)]
 
 
-def find_heading_position(text: str, heading: str) -> int:
+def locate_headings(text: str, headings: List[Dict[str, Any]], page_offsets: List[Dict[str, Any]]) -> List[tuple]:
     """
-    Find the position of a heading in text.
+    Find where each heading starts in text, in one forward pass.
+    
+    Uses the offset recorded by analyze_structure when available; otherwise
+    searches the heading's page span from the previous heading onwards, so
+    a heading is never matched before the one preceding it (e.g. in the
+    table of contents).
     
     Args:
         text: Full text
-        heading: Heading text to find
+        headings: Headings in document order
+        page_offsets: Page spans of text ({page, start, end})
         
     Returns:
-        Position index, or 0 if not found
+        (start position, matched heading length) per heading; length is 0
+        when the heading was not found and start falls back to its page start
     """
-    if not heading:
-        return len(text)
-    
-    # Try exact match first
-    pos = text.find(heading)
-    if pos != -1:
-        return pos
+    spans = {span["page"]: (span["start"], span["end"]) for span in page_offsets}
+    positions = []
+    cursor = 0
     
-    # Try case-insensitive
-    pattern = re.compile(re.escape(heading), re.IGNORECASE)
-    match = pattern.search(text)
-    if match:
-        return match.start()
+    for heading in headings:
+        heading_text = heading["text"]
+        page_start, page_end = spans.get(heading.get("page"), (0, len(text)))
+        
+        offset = heading.get("offset")
+        if offset is not None and offset >= cursor:
+            positions.append((offset, len(heading_text)))
+            cursor = offset + len(heading_text)
+            continue
+        
+        # Search this heading's page, never before the previous heading
+        window_start = max(cursor, page_start)
+        pos = text.find(heading_text, window_start, max(page_end, window_start))
+        if pos == -1:
+            pattern = re.compile(re.escape(heading_text), re.IGNORECASE)
+            match = pattern.search(text, window_start, max(page_end, window_start))
+            pos = match.start() if match else -1
+        
+        if pos == -1:
+            positions.append((window_start, 0))
+            cursor = window_start
+        else:
+            positions.append((pos, len(heading_text)))
+            cursor = pos + len(heading_text)
     
-    return 0
+    return positions
 
 
 def organize_sections(sections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -243,39 +299,48 @@ def organize_sections(sections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     Returns:
         Cleaned and organized sections
     """
-    organized = []
+    organized = (organize_section(section) for section in sections)
+    return [section for section in organized if section is not None]
+
+
+def organize_section(section: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Clean one section and its subsections.
     
-    for section in sections:
-        # Skip empty sections
-        if not section.get("content", "").strip() and not section.get("subsections"):
-            continue
-        
-        # Clean content
-        content = section.get("content", "").strip()
-        content = clean_text(content)
-        
-        # Clean subsections
-        subsections = []
-        for sub in section.get("subsections", []):
-            sub_content = sub.get("content", "").strip()
-            sub_content = clean_text(sub_content)
-            if sub_content:
-                subsections.append({
-                    "id": sub.get("id", slugify(sub.get("title", ""))),
-                    "title": sub.get("title", "").strip(),
-                    "content": sub_content,
-                    "order": sub.get("order", 0),
-                })
+    Args:
+        section: Section to clean
         
-        organized.append({
-            "id": section.get("id", slugify(section.get("title", ""))),
-            "title": section.get("title", "").strip(),
-            "content": content,
-            "order": section.get("order", 0),
-            "subsections": subsections,
-        })
+    Returns:
+        Cleaned section, or None if it is empty
+    """
+    # Skip empty sections
+    if not section.get("content", "").strip() and not section.get("subsections"):
+        return None
+    
+    # Clean content
+    content = section.get("content", "").strip()
+    content = clean_text(content)
+    
+    # Clean subsections
+    subsections = []
+    for sub in section.get("subsections", []):
+        sub_content = sub.get("content", "").strip()
+        sub_content = clean_text(sub_content)
+        if sub_content:
+            subsections.append({
+                "id": sub.get("id", slugify(sub.get("title", ""))),
+                "title": sub.get("title", "").strip(),
+                "content": sub_content,
+                "order": sub.get("order", 0),
+            })
     
-    return organized
+    return {
+        "id": section.get("id", slugify(section.get("title", ""))),
+        "title": section.get("title", "").strip(),
+        "content": content,
+        "order": section.get("order", 0),
+        "subsections": subsections,
+    }
 
 
 def clean_text(text: str) -> str:
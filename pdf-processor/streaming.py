@@ -0,0 +1,127 @@
+"""
+Streaming document processing.
+Runs a PDF through the worker pool and yields page progress and each parsed
+section as events, so clients can render the first sections before the whole
+document is done.
+"""
+
+import asyncio
+import json
+import os
+import uuid
+from typing import Dict, Any, AsyncIterator
+
+from worker_pool import process_document, submit_to_pool, subscribe, unsubscribe
+
+# Send a heartbeat when nothing happened for this long, so proxies and
+# gateways don't close the connection as idle
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", 15))
+
+
+def start_stream(pdf_url: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Start processing a PDF and return its event stream.
+    
+    The document is submitted immediately, so a full queue is reported
+    before any response is sent.
+    
+    Events:
+        {"event": "progress", "page", "totalPages"} after each extracted page
+        {"event": "section", "section"} for each parsed section, in order
+        {"event": "heartbeat"} while nothing else happens
+        {"event": "done", "metadata"} at the end
+        {"event": "error", "error"} if processing failed
+    
+    Args:
+        pdf_url: URL to the PDF file
+    
+    Returns:
+        Async iterator of event dictionaries
+    
+    Raises:
+        QueueFullError: If every worker is busy and the queue is full
+    """
+    token = uuid.uuid4().hex
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    
+    # Listeners run on the event drain thread; hand events to the loop
+    subscribe(token, lambda event: loop.call_soon_threadsafe(events.put_nowait, event))
+    try:
+        future = submit_to_pool(process_document, pdf_url, token, True)
+    except Exception:
+        unsubscribe(token)
+        raise
+    
+    return _stream_events(token, events, future)
+
+
+async def _stream_events(token: str, events: asyncio.Queue, future: asyncio.Future) -> AsyncIterator[Dict[str, Any]]:
+    """Yield worker events until the document is done, then its outcome."""
+    streamed = 0
+    getter = None
+    
+    try:
+        while not future.done():
+            getter = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait(
+                {getter, future},
+                timeout=STREAM_HEARTBEAT_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            
+            if getter in done:
+                event = getter.result()
+                if event.get("event") == "section":
+                    streamed += 1
+                yield event
+                continue
+            
+            getter.cancel()
+            if not done:
+                yield {"event": "heartbeat"}
+        
+        unsubscribe(token)
+        
+        # Events that arrived before the result
+        while not events.empty():
+            event = events.get_nowait()
+            if event.get("event") == "section":
+                streamed += 1
+            yield event
+        
+        try:
+            result = future.result()
+        except Exception as e:
+            yield {"event": "error", "error": f"Failed to process PDF: {str(e)}"}
+            return
+        
+        # Sections whose events are still in flight, or all of them for a cached result
+        for section in result["sections"][streamed:]:
+            yield {"event": "section", "section": section}
+        
+        yield {"event": "done", "metadata": result["metadata"]}
+    finally:
+        # Client gone or stream finished; the document itself runs to completion
+        unsubscribe(token)
+        if getter is not None and not getter.done():
+            getter.cancel()
+
+
+async def encode_events(events: AsyncIterator[Dict[str, Any]], sse: bool = False) -> AsyncIterator[str]:
+    """
+    Serialize events as NDJSON lines or server-sent events.
+    
+    Args:
+        events: Event dictionaries
+        sse: Encode as text/event-stream instead of NDJSON
+    
+    Yields:
+        Encoded events
+    """
+    async for event in events:
+        data = json.dumps(event, ensure_ascii=False)
+        if sse:
+            yield f"event: {event['event']}\ndata: {data}\n\n"
+        else:
+            yield data + "\n"
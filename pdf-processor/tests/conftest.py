@@ -0,0 +1,11 @@
+import os
+import sys
+from pathlib import Path
+
+# Run the pool in threads and keep caches out of the way, before the service modules are imported
+os.environ.setdefault("PROCESSING_MODE", "thread")
+os.environ.setdefault("WORKER_COUNT", "2")
+os.environ.setdefault("RESULT_CACHE_ENABLED", "false")
+os.environ.setdefault("PREDICTION_CACHE_ENABLED", "false")
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -0,0 +1,82 @@
+import asyncio
+
+import batch
+import ml_models
+from worker_pool import QueueFullError
+from pdf_extractor import TextRun, heading_queries
+
+
+def fake_extract(pdf_url):
+    if "broken" in pdf_url:
+        raise RuntimeError("download failed")
+
+    runs = [
+        TextRun("Counting up", 10, False, 1, 0, 0, 1, 1),
+        TextRun("Each player adds their points together.", 10, False, 1, 0, 2, 1, 3),
+    ]
+    text = "Counting up\nEach player adds their points together.\n"
+    pages_data = [{"page": 1, "text": text, "text_offset": 0, "runs": runs}]
+    return {
+        "key": None,
+        "pdf_structure": {
+            "full_text": text,
+            "pages_data": pages_data,
+            "page_offsets": [{"page": 1, "start": 0, "end": len(text)}],
+            "structure": None,
+            "total_pages": 1,
+            "has_images": False,
+            "has_tables": False,
+        },
+        "heading_queries": heading_queries(pages_data),
+    }
+
+
+def test_batch_shares_one_model_run_per_task(monkeypatch):
+    calls = {"headings": [], "types": []}
+
+    def fake_headings(blocks):
+        calls["headings"].append(len(blocks))
+        return [{"is_heading": block["text"] == "Counting up", "confidence": 0.9, "method": "ml"} for block in blocks]
+
+    def fake_types(items):
+        calls["types"].append(len(items))
+        return [{"section_type": "scoring", "confidence": 0.9, "method": "ml"} for _ in items]
+
+    parsed = []
+    parse_document = batch.parse_document
+    
+    def recording_parse(key, pdf_structure, type_predictions=None):
+        parsed.append((pdf_structure, type_predictions))
+        return parse_document(key, pdf_structure, type_predictions)
+    
+    monkeypatch.setattr(batch, "extract_document", fake_extract)
+    monkeypatch.setattr(batch, "parse_document", recording_parse)
+    monkeypatch.setattr(batch, "ml_available", lambda: True)
+    monkeypatch.setattr(ml_models, "predict_section_headings", fake_headings)
+    monkeypatch.setattr(ml_models, "predict_section_types", fake_types)
+
+    outcomes = asyncio.run(batch.process_batch(["a.pdf", "broken.pdf", "c.pdf"]))
+
+    # Predictions for both documents in one call each, without the prediction cache
+    assert calls == {"headings": [4], "types": [2]}
+    assert [[p["section_type"] for p in predictions] for _, predictions in parsed] == [["scoring"], ["scoring"]]
+    # Text runs stay out of the parse step
+    for pdf_structure, _ in parsed:
+        assert "pages_data" not in pdf_structure
+        assert "blocks" not in pdf_structure["structure"]
+    assert outcomes[1] == {"error": "Failed to process PDF: download failed", "status": 500}
+    for outcome in (outcomes[0], outcomes[2]):
+        sections = outcome["result"]["sections"]
+        assert [section["title"] for section in sections] == ["Counting up"]
+
+
+def test_batch_reports_503_when_queue_stays_full(monkeypatch):
+    async def full_pool(fn, *args):
+        raise QueueFullError("Processing queue is full (6 documents in progress)")
+    
+    monkeypatch.setattr(batch, "run_in_pool", full_pool)
+    monkeypatch.setattr(batch, "BATCH_QUEUE_WAIT_SECONDS", 0.05)
+    
+    outcomes = asyncio.run(batch.process_batch(["a.pdf", "b.pdf"]))
+    
+    assert outcomes == [{"error": "Processing queue is full (6 documents in progress)", "status": 503}] * 2
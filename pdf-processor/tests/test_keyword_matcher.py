@@ -0,0 +1,42 @@
+from keyword_matcher import KeywordMatcher
+
+
+def matches(matcher, text):
+    return [(text[start:end], keyword) for start, end, keyword, _ in matcher.finditer(text)]
+
+
+def test_longest_keyword_wins_at_each_position():
+    matcher = KeywordMatcher({name: name for name in ["Setup", "Set Up", "Rules", "Rules of Play"]})
+    
+    assert matches(matcher, "Set Up the board, then read the Rules of Play.") == [
+        ("Set Up", "Set Up"),
+        ("Rules of Play", "Rules of Play"),
+    ]
+    assert matches(matcher, "Setup") == [("Setup", "Setup")]
+    # A partial longer keyword falls back to the shorter one
+    assert matches(matcher, "Rules of thumb") == [("Rules", "Rules")]
+
+
+def test_matching_ignores_case():
+    matcher = KeywordMatcher({"Setup": "setup"})
+    
+    assert matches(matcher, "SETUP and setup") == [("SETUP", "Setup"), ("setup", "Setup")]
+
+
+def test_first_label_wins_for_repeated_keywords():
+    matcher = KeywordMatcher({"goal": "objective", "Goal": "scoring"})
+    
+    assert matcher.labels("Goal of the game") == {"objective"}
+
+
+def test_longer_keyword_shadows_overlapping_shorter_ones():
+    matcher = KeywordMatcher({"victory": "objective", "points": "scoring", "victory points": "scoring"})
+    
+    assert matcher.labels("Victory Points") == {"scoring"}
+    assert matcher.labels("Victory, then points") == {"objective", "scoring"}
+
+
+def test_keywords_match_inside_words():
+    matcher = KeywordMatcher({"goal": "objective"})
+    
+    assert matcher.search("Goalkeeper") == (0, 4, "goal", "objective")
@@ -0,0 +1,22 @@
+import time
+
+import prediction_cache
+from prediction_cache import PredictionCache
+
+
+def test_disk_hits_only_refresh_stale_used_at(tmp_path):
+    db_path = str(tmp_path / "predictions.db")
+    PredictionCache(10, db_path, 100).put_many({"fresh": 1, "stale": 2})
+    
+    cache = PredictionCache(10, db_path, 100)
+    old = time.time() - prediction_cache.USED_AT_REFRESH_SECONDS - 1
+    with cache._conn:
+        cache._conn.execute("UPDATE predictions SET usedAt = ? WHERE key = 'stale'", (old,))
+    changes = cache._conn.total_changes
+    
+    assert cache.get_many(["fresh", "stale"]) == {"fresh": 1, "stale": 2}
+    
+    # Only the stale row is written
+    assert cache._conn.total_changes - changes == 1
+    used_at = dict(cache._conn.execute("SELECT key, usedAt FROM predictions"))
+    assert used_at["stale"] > old
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+import worker_pool
+from prediction_cache import PredictionCache
+
+
+def test_failed_warm_up_is_not_ready(monkeypatch):
+    def broken_worker_status():
+        raise RuntimeError("model files missing")
+    
+    monkeypatch.setattr(worker_pool, "_readiness", {"ready": False, "models": {}, "workers": 0})
+    monkeypatch.setattr(worker_pool, "worker_status", broken_worker_status)
+    
+    asyncio.run(worker_pool.warm_pool())
+    
+    state = worker_pool.readiness()
+    assert state["ready"] is False
+    assert state["error"] == "model files missing"
+
+
+def test_cancelled_request_holds_its_slot_until_the_work_ends():
+    started = threading.Event()
+    release = threading.Event()
+    
+    def slow_task():
+        started.set()
+        release.wait(5)
+    
+    async def run():
+        future = worker_pool.submit_to_pool(slow_task)
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        future.cancel()
+        await asyncio.sleep(0.05)
+        
+        # The worker is still busy, so the slot is still taken
+        assert worker_pool.queue_stats()["inFlight"] == 1
+        
+        release.set()
+        for _ in range(100):
+            if worker_pool.queue_stats()["inFlight"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert worker_pool.queue_stats()["inFlight"] == 0
+    
+    asyncio.run(run())
+
+
+def test_health_reports_worker_prediction_cache_counters(monkeypatch):
+    cache = PredictionCache(10)
+    cache.put_many({"a": 1})
+    
+    def lookup():
+        cache.get_many(["a", "b"])
+    
+    monkeypatch.setattr(worker_pool, "PREDICTION_CACHE_ENABLED", True)
+    monkeypatch.setattr(worker_pool, "get_prediction_cache", lambda: cache)
+    monkeypatch.setattr(worker_pool, "_prediction_cache_stats", {})
+    
+    async def run():
+        await worker_pool.run_in_pool(lookup)
+        for _ in range(100):
+            if worker_pool.prediction_cache_stats()["hits"]:
+                break
+            await asyncio.sleep(0.01)
+    
+    asyncio.run(run())
+    
+    assert worker_pool.prediction_cache_stats() == {"hits": 1, "misses": 1, "size": 1, "maxSize": 10}
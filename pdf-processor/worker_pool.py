@@ -0,0 +1,520 @@
+"""
+Worker pool for the PDF extraction and parsing pipeline.
+Runs CPU-heavy document processing off the event loop and bounds how many
+documents may wait for a worker.
+"""
+
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Callable, List, Optional
+
+from pdf_extractor import (
+    download_pdf, extract_pdf_structure, analyze_structure, heading_queries, ml_available
+)
+from rule_parser import iter_rules
+from cache import get_result_cache, result_key
+from prediction_cache import get_prediction_cache, PREDICTION_CACHE_ENABLED
+
+
+def available_cpus() -> int:
+    """
+    CPUs this container may use.
+    
+    Honors the cgroup CPU quota (e.g. Cloud Run's vCPU limit), which
+    os.cpu_count() ignores by reporting every core on the host.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    
+    quota = None
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            limit, period = f.read().split()[:2]
+        if limit != "max":
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                limit = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    
+    if quota:
+        # Round down: threads beyond the quota only get throttled
+        cpus = min(cpus, int(quota))
+    
+    return max(1, cpus)
+
+
+# "process" runs documents in worker processes (one per available CPU by
+# default), "thread" runs them in a thread pool inside the API process
+PROCESSING_MODE = os.getenv("PROCESSING_MODE", "process")
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", available_cpus()))
+# Documents allowed to wait for a free worker before requests are rejected
+MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", WORKER_COUNT * 2))
+# Inference threads per worker; by default the CPU quota is split between workers
+ML_THREADS = int(os.getenv("ML_THREADS", max(1, available_cpus() // WORKER_COUNT)))
+# Start workers and warm up the models at startup instead of on the first request
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "true").lower() == "true"
+
+# Pool instance (created lazily)
+_executor = None
+_in_flight = 0
+
+# Progress events from workers: (token, event) tuples drained by a thread in
+# the API process and handed to the listener subscribed for that token
+_events = None
+_listeners: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+_drain_thread = None
+
+# Token for prediction cache counters that workers report after each task
+PREDICTION_CACHE_TOKEN = "prediction-cache"
+# Latest prediction cache counters per worker process, as seen from the API process
+_prediction_cache_stats: Dict[int, Dict[str, int]] = {}
+
+# Models loaded in this worker, set by _init_worker
+_worker_models: Dict[str, bool] = {}
+# Readiness of the pool as seen from the API process
+_readiness: Dict[str, Any] = {"ready": not PRELOAD_MODELS, "models": {}, "workers": 0}
+
+
+class QueueFullError(Exception):
+    """Raised when all workers are busy and the wait queue is full."""
+
+
+def _init_worker(events=None):
+    """Load and warm up ML models once per worker so requests don't pay for it."""
+    global _events, _worker_models
+    _events = events
+    
+    try:
+        from ml_models import ml_stack_available, set_thread_count, warm_up
+    except ImportError:
+        return  # ML models not available, pattern-based parsing only
+    
+    if not ml_stack_available():
+        return
+    
+    set_thread_count(ML_THREADS)
+    _worker_models = warm_up()
+
+
+def worker_status() -> Dict[str, Any]:
+    """Report which models this worker loaded (runs in the worker)."""
+    return {"worker": f"{os.getpid()}:{threading.get_ident()}", "models": _worker_models}
+
+
+def emit(token: Optional[str], event: Dict[str, Any]):
+    """
+    Send an event from a worker to the listener subscribed for token.
+    
+    Args:
+        token: Subscription token (no-op if None)
+        event: JSON-serializable event dictionary
+    """
+    if token is None or _events is None:
+        return
+    _events.put((token, event))
+
+
+def _run_task(fn: Callable, *args) -> Any:
+    """Run fn in a worker, then report the worker's prediction cache counters."""
+    try:
+        return fn(*args)
+    finally:
+        cache = get_prediction_cache()
+        if cache is not None:
+            emit(PREDICTION_CACHE_TOKEN, {"worker": os.getpid(), **cache.stats()})
+
+
+def _record_prediction_cache_stats(event: Dict[str, Any]):
+    """Keep a worker's latest prediction cache counters (runs on the drain thread)."""
+    _prediction_cache_stats[event["worker"]] = {key: value for key, value in event.items() if key != "worker"}
+
+
+def process_document(pdf_url: str, token: Optional[str] = None, stream_sections: bool = False) -> Dict[str, Any]:
+    """
+    Run the full extraction and parsing pipeline for one PDF.
+    
+    Args:
+        pdf_url: URL to the PDF file
+        token: Optional subscription token for page progress events
+        stream_sections: Also emit each section to token as soon as it is parsed
+    
+    Returns:
+        Dictionary with sections and metadata
+    """
+    def on_page(page: int, total_pages: int):
+        emit(token, {"event": "progress", "page": page, "totalPages": total_pages})
+    
+    with download_pdf(pdf_url) as pdf_file:
+        # Same PDF, parser and models: reuse the stored result
+        cache = get_result_cache()
+        if cache is not None:
+            key = result_key(pdf_file.sha256)
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        
+        # Extract PDF structure
+        pdf_structure = extract_pdf_structure(pdf_url, progress_callback=on_page, pdf_file=pdf_file)
+    
+    # Parse rules into sections
+    sections = []
+    for section in iter_rules(pdf_structure):
+        sections.append(section)
+        if stream_sections:
+            emit(token, {"event": "section", "section": section})
+    
+    result = {"sections": sections, "metadata": document_metadata(pdf_structure)}
+    if cache is not None:
+        cache.put(key, result)
+    
+    return result
+
+
+def document_metadata(pdf_structure: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the response metadata for an extracted PDF."""
+    return {
+        "totalPages": pdf_structure.get("total_pages", 0),
+        "hasImages": pdf_structure.get("has_images", False),
+        "hasTables": pdf_structure.get("has_tables", False),
+    }
+
+
+def extract_document(pdf_url: str) -> Dict[str, Any]:
+    """
+    Download and extract one PDF of a batch, leaving structure analysis to
+    analyze_document so its inference can be shared across the batch.
+    
+    Args:
+        pdf_url: URL to the PDF file
+    
+    Returns:
+        {"result"} for a PDF already in the result cache, otherwise
+        {"key", "pdf_structure", "heading_queries"} with the result cache
+        key (or None) and the section heading model inputs
+    """
+    with download_pdf(pdf_url) as pdf_file:
+        key = None
+        cache = get_result_cache()
+        if cache is not None:
+            key = result_key(pdf_file.sha256)
+            cached = cache.get(key)
+            if cached is not None:
+                return {"result": cached}
+        
+        pdf_structure = extract_pdf_structure(pdf_url, pdf_file=pdf_file, analyze=False)
+    
+    return {
+        "key": key,
+        "pdf_structure": pdf_structure,
+        "heading_queries": heading_queries(pdf_structure["pages_data"]),
+    }
+
+
+def _predict_per_document(predict: Callable, queries: List[List[Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+    """Run predict once over the queries of several documents and split the results per document."""
+    predictions = predict([query for document_queries in queries for query in document_queries])
+    
+    per_document = []
+    start = 0
+    for document_queries in queries:
+        per_document.append(predictions[start:start + len(document_queries)])
+        start += len(document_queries)
+    return per_document
+
+
+def predict_document_headings(queries: List[List[Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+    """
+    Predict section headings for several documents in shared batches.
+    
+    Args:
+        queries: heading_queries() of each document
+    
+    Returns:
+        Heading predictions per document, for analyze_document
+    """
+    from ml_models import predict_section_headings
+    return _predict_per_document(predict_section_headings, queries)
+
+
+def predict_document_section_types(queries: List[List[Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+    """
+    Predict section types for several documents in shared batches.
+    
+    Args:
+        queries: section_type_queries() of each document's headings
+    
+    Returns:
+        Section type predictions per document, for parse_document
+    """
+    from ml_models import predict_section_types
+    return _predict_per_document(predict_section_types, queries)
+
+
+def analyze_document(pages_data: List[Dict[str, Any]], heading_predictions: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Detect an extracted document's structure.
+    
+    Args:
+        pages_data: Pages of extract_document output's pdf_structure
+        heading_predictions: From predict_document_headings (None runs the model here)
+    
+    Returns:
+        The structure for pdf_structure["structure"], without its blocks
+    """
+    structure = analyze_structure(pages_data, use_ml=ml_available(), heading_predictions=heading_predictions)
+    # The blocks repeat the text runs; parsing only needs the headings
+    del structure["blocks"]
+    return structure
+
+
+def parse_document(key: Optional[str], pdf_structure: Dict[str, Any], type_predictions: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Parse an analyzed document into sections and cache the result.
+    
+    Args:
+        key: Result cache key (None skips caching)
+        pdf_structure: Extracted document with its structure (pages_data
+            isn't needed)
+        type_predictions: From predict_document_section_types (None runs the model here)
+    
+    Returns:
+        Dictionary with sections and metadata
+    """
+    result = {
+        "sections": list(iter_rules(pdf_structure, type_predictions)),
+        "metadata": document_metadata(pdf_structure),
+    }
+    
+    cache = get_result_cache()
+    if cache is not None and key is not None:
+        cache.put(key, result)
+    
+    return result
+
+
+def _drain_events(events):
+    """Dispatch worker events to subscribed listeners until shutdown."""
+    while True:
+        item = events.get()
+        if item is None:
+            break
+        
+        token, event = item
+        listener = _listeners.get(token)
+        if listener is None:
+            continue
+        
+        try:
+            listener(event)
+        except Exception as e:
+            print(f"Event listener error: {e}")
+
+
+def subscribe(token: str, listener: Callable[[Dict[str, Any]], None]):
+    """
+    Receive events emitted for token.
+    
+    The listener runs on the event drain thread, not the event loop.
+    
+    Args:
+        token: Subscription token passed to the worker function
+        listener: Function called with each event dictionary
+    """
+    _listeners[token] = listener
+
+
+def unsubscribe(token: str):
+    """Stop receiving events for token."""
+    _listeners.pop(token, None)
+
+
+def get_executor():
+    """Get the pool executor, creating it on first use."""
+    global _executor, _events, _drain_thread
+    
+    if _executor is None:
+        if PROCESSING_MODE == "process":
+            # spawn avoids forking a parent that may already hold torch threads
+            context = multiprocessing.get_context("spawn")
+            if _events is None:
+                _events = context.Queue()
+            _executor = ProcessPoolExecutor(
+                max_workers=WORKER_COUNT,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(_events,),
+            )
+        else:
+            if _events is None:
+                _events = queue.Queue()
+            _executor = ThreadPoolExecutor(
+                max_workers=WORKER_COUNT,
+                initializer=_init_worker,
+                initargs=(_events,),
+            )
+        
+        if _drain_thread is None:
+            subscribe(PREDICTION_CACHE_TOKEN, _record_prediction_cache_stats)
+            _drain_thread = threading.Thread(
+                target=_drain_events, args=(_events,), daemon=True
+            )
+            _drain_thread.start()
+    
+    return _executor
+
+
+def submit_to_pool(fn: Callable, *args) -> "asyncio.Future":
+    """
+    Start a function in the worker pool and return a future for its result.
+    
+    Args:
+        fn: Module-level function to run (must be picklable in process mode)
+        *args: Arguments for the function
+    
+    Returns:
+        Future resolving to the function's return value; cancelling it
+        only drops work that hasn't started
+    
+    Raises:
+        QueueFullError: If every worker is busy and the queue is full
+    """
+    global _executor, _in_flight
+    
+    # Only touched from the event loop thread, so no lock is needed
+    if _in_flight >= WORKER_COUNT + MAX_QUEUE_SIZE:
+        raise QueueFullError(
+            f"Processing queue is full ({_in_flight} documents in progress)"
+        )
+    
+    loop = asyncio.get_running_loop()
+    try:
+        future = get_executor().submit(_run_task, fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); start a fresh pool next time
+        _executor = None
+        raise
+    _in_flight += 1
+    
+    # The slot is held until the pool is done with the work, even if the
+    # caller stopped waiting (e.g. the client disconnected)
+    def on_done(future: concurrent.futures.Future):
+        try:
+            loop.call_soon_threadsafe(_pool_task_done, future)
+        except RuntimeError:
+            pass  # Event loop already closed
+    
+    future.add_done_callback(on_done)
+    return asyncio.wrap_future(future, loop=loop)
+
+
+def _pool_task_done(future: concurrent.futures.Future):
+    """Release the task's queue slot (runs on the event loop)."""
+    global _executor, _in_flight
+    
+    _in_flight -= 1
+    if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+        # A worker died (e.g. out of memory); start a fresh pool next time
+        _executor = None
+
+
+async def run_in_pool(fn: Callable, *args) -> Any:
+    """
+    Run a function in the worker pool without blocking the event loop.
+    
+    Args:
+        fn: Module-level function to run (must be picklable in process mode)
+        *args: Arguments for the function
+    
+    Returns:
+        The function's return value
+    
+    Raises:
+        QueueFullError: If every worker is busy and the queue is full
+    """
+    return await submit_to_pool(fn, *args)
+
+
+async def warm_pool():
+    """
+    Start every worker so models are loaded and warmed up before the first
+    request, and record readiness.
+    """
+    try:
+        # One task per worker; each submission starts a worker while none are idle
+        statuses = await asyncio.gather(*(run_in_pool(worker_status) for _ in range(WORKER_COUNT)))
+    except Exception as e:
+        # Stay not ready; /ready reports the error instead of warming forever
+        print(f"Model warm-up failed: {e}")
+        _readiness.update(ready=False, error=str(e))
+        return
+    
+    models = {}
+    for status in statuses:
+        for name, loaded in status["models"].items():
+            models[name] = models.get(name, True) and loaded
+    
+    _readiness.update(
+        ready=True,
+        models=models,
+        workers=len({status["worker"] for status in statuses}),
+    )
+
+
+def readiness() -> Dict[str, Any]:
+    """Whether models are loaded and warmed up, for the readiness endpoint."""
+    return dict(_readiness)
+
+
+def queue_stats() -> Dict[str, int]:
+    """Current pool load, for health reporting."""
+    return {
+        "workers": WORKER_COUNT,
+        "inFlight": _in_flight,
+        "maxQueued": MAX_QUEUE_SIZE,
+    }
+
+
+def prediction_cache_stats() -> Optional[Dict[str, int]]:
+    """
+    Prediction cache counters summed over the workers that reported them,
+    for health reporting.
+    
+    Returns:
+        hits, misses, size and maxSize, or None if the cache is disabled
+    """
+    if not PREDICTION_CACHE_ENABLED:
+        return None
+    
+    totals = {"hits": 0, "misses": 0, "size": 0, "maxSize": 0}
+    for stats in list(_prediction_cache_stats.values()):
+        for name in totals:
+            totals[name] += stats.get(name, 0)
+    return totals
+
+
+def shutdown():
+    """Stop the pool, its workers and the event drain thread."""
+    global _executor, _events, _drain_thread
+    
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    
+    if _events is not None:
+        _events.put(None)
+        _events = None
+        _drain_thread = None